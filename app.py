@@ -1,7 +1,14 @@
 from flask import Flask, jsonify, request
+from pymongo.errors import WaitQueueTimeoutError
 from flask_cors import CORS
 from routes.auth import auth_bp
 from routes.chatbot import chat_bp
+from db.mongo import health
+from utils.admission import model_admission
+from utils.model_loader import generation_flight
+from utils.answer_store import answer_store
+from utils.scheduler import model_scheduler
+from utils import metrics, tracing
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -10,6 +17,8 @@ CORS(app)
 
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
 app.register_blueprint(chat_bp, url_prefix="/api/chat")
+metrics.init_app(app)
+tracing.init_app(app)
 
 
 @app.route('/')
@@ -17,6 +26,23 @@ def index():
     return jsonify({'status': 'ok', 'message': 'Healthcare Chatbot backend running', 'routes': [r.rule for r in app.url_map.iter_rules()]})
 
 
+@app.route('/health')
+def health_check():
+    """Liveness of the database connection, pool utilization and model queue state."""
+    status = health()
+    return jsonify({'status': 'ok' if status['ok'] else 'degraded', 'db': status,
+                    'model_admission': model_admission.stats(),
+                    'generation': generation_flight.stats(),
+                    'answer_store': answer_store.stats(),
+                    'scheduler': model_scheduler.stats()}), 200 if status['ok'] else 503
+
+
+@app.errorhandler(WaitQueueTimeoutError)
+def pool_exhausted(e):
+    # every pooled Mongo connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return jsonify({'error': 'Database busy, retry shortly'}), 503, {'Retry-After': '1'}
+
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({'error': 'Not found', 'path': request.path}), 404
@@ -28,6 +54,9 @@ def server_error(e):
 
 
 if __name__ == "__main__":
+    # deployments run `python create_indexes.py` instead; importing the app never touches Mongo
+    from db.indexes import ensure_indexes
+    ensure_indexes()
     logging.info("Registered routes:")
     for r in app.url_map.iter_rules():
         logging.info(f"{r.rule} -> {r.endpoint}")
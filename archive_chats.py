@@ -0,0 +1,33 @@
+"""Move chats older than the retention window into compressed segment files.
+
+    python archive_chats.py [--days 180] [--dry_run]
+
+Run it from cron or a scheduler. Archived turns stay readable through
+/history, /patient/<id>/history and the exports (see db/archive.py).
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta
+from config import ARCHIVE_RETENTION_DAYS, ARCHIVE_BLOCK_DOCS
+from db.chat_store import chat_store
+from db.archive import chat_archive
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old chats to local segment files')
+    parser.add_argument('--days', type=int, default=ARCHIVE_RETENTION_DAYS, help='Retention window in days')
+    parser.add_argument('--block_docs', type=int, default=ARCHIVE_BLOCK_DOCS, help='Turns per compressed block')
+    parser.add_argument('--dry_run', action='store_true', help='Only count what would be archived')
+    args = parser.parse_args()
+
+    cutoff = datetime.utcnow() - timedelta(days=args.days)
+    logger.info(f"Archiving {chat_store.mode}-layout chats older than {cutoff.isoformat()} to {chat_archive.root}")
+    moved = chat_archive.archive_expired(chat_store, cutoff, block_docs=args.block_docs, dry_run=args.dry_run)
+    logger.info(f"{'Would archive' if args.dry_run else 'Archived'} {moved} turns")
+
+
+if __name__ == "__main__":
+    main()
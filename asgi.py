@@ -0,0 +1,191 @@
+"""Asyncio serving mode: `uvicorn asgi:app --host 0.0.0.0 --port 5000`.
+
+The endpoints that mostly wait run natively on the event loop: /api/chat/ask
+(model generation goes to a small thread pool, so queued requests don't each
+hold a thread) and the /api/chat/events SSE stream (one coroutine per client
+instead of one thread), with users looked up through pymongo's asyncio client.
+Every other route is served by the unchanged Flask app through a WSGI bridge,
+so both modes expose the same API.
+
+Needs `pip install starlette uvicorn a2wsgi`; `python app.py` keeps working
+without them.
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial, wraps
+from bson.objectid import ObjectId
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # starlette's bridge is deprecated but still works
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+from app import app as flask_app
+from config import ASYNC_MODEL_WORKERS, EVENTS_HEARTBEAT
+from db.mongo import get_async_db
+from db.write_behind import chat_writer
+from routes.chatbot import SSE_PREAMBLE, SSE_RESYNC, ask_document, event_keys, prepare_ask, sse_frame
+from utils.admission import AdmissionRejected, model_admission
+from utils.auth import EVENTS_PURPOSE, decode_bearer, query_token
+from utils.events import event_hub
+from utils.metrics import observe_request, request_in_flight
+from utils import tracing
+from utils.model_loader import generate_answer
+from utils.serialization import JSON_MIMETYPE, dumps
+
+log = logging.getLogger(__name__)
+
+model_executor = ThreadPoolExecutor(max_workers=ASYNC_MODEL_WORKERS, thread_name_prefix='model')
+
+
+def _timed(blueprint: str, route: str):
+    """Request metrics and tracing for the native routes (the Flask app does its own)."""
+    def decorate(endpoint):
+        @wraps(endpoint)
+        async def wrapper(request):
+            started = time.perf_counter()
+            token = tracing.begin(request.method, request.url.path)
+            try:
+                with request_in_flight(blueprint):
+                    response = await endpoint(request)
+                tracing.finish(tracing.current(), response.headers, route=route, status=response.status_code)
+            finally:
+                tracing.end(token)
+            observe_request(blueprint, route, request.method, response.status_code, time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorate
+
+
+def _release_ticket(user_id: str, started: float, future):
+    failed = future.cancelled() or future.exception() is not None
+    model_admission.release(user_id, None if failed else time.monotonic() - started)
+
+
+def _json(payload, status: int = 200) -> Response:
+    return Response(dumps(payload), status_code=status, media_type=JSON_MIMETYPE)
+
+
+async def _current_user(request, projection=None):
+    """(user, None) for the request's bearer token, else (None, error response)."""
+    auth = request.headers.get('authorization')
+    purpose = None
+    if not auth:
+        # EventSource cannot set headers, so SSE requests pass an /events/token as ?token=
+        auth = query_token(request.query_params.get('token'), request.headers.get('accept'))
+        purpose = EVENTS_PURPOSE if auth else None
+    with tracing.span('auth'):
+        user_id, error = decode_bearer(auth, purpose)
+        user = None if error else await get_async_db().users.find_one({'_id': ObjectId(user_id)}, projection)
+    if error:
+        return None, _json({'error': error}, 401)
+    if not user:
+        return None, _json({'error': 'User not found'}, 401)
+    tracing.identify(str(user['_id']), user.get('role') or 'patient')
+    return user, None
+
+
+@_timed('chat', '/api/chat/ask')
+async def ask(request):
+    user, denied = await _current_user(request)
+    if denied:
+        return denied
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    plan, error = prepare_ask(data, user.get('role') or 'patient')
+    if error:
+        return _json({'error': error}, 400)
+
+    user_id = str(user['_id'])
+    loop = asyncio.get_running_loop()
+    answer = plan.answer
+    if plan.generation:
+        # admitted on the loop, so requests queued for a model thread count against admission control
+        try:
+            model_admission.try_admit(user_id, plan.generation['priority'])
+        except AdmissionRejected as e:
+            return Response(dumps({'error': e.message}), status_code=e.status, media_type=JSON_MIMETYPE,
+                            headers=e.headers())
+        # run in a copy of this context so the worker thread's spans land in this request's trace
+        future = loop.run_in_executor(model_executor, copy_context().run,
+                                      partial(generate_answer, plan.question, **plan.generation))
+        future.add_done_callback(partial(_release_ticket, user_id, time.monotonic()))
+        # a client disconnect cancels this task but not the generation; the ticket is held until it ends
+        answer = await asyncio.shield(future)
+    doc = ask_document(user_id, plan, answer)
+    # the write-behind buffer may write a spool file (or Mongo, when disabled); keep it off the loop
+    inserted_id = await loop.run_in_executor(None, copy_context().run, chat_writer.insert, doc)
+    return _json({'answer': answer, 'message_id': str(inserted_id), 'source': doc['source']})
+
+
+@_timed('chat', '/api/chat/events')
+async def events(request):
+    user, denied = await _current_user(request, {'role': 1})
+    if denied:
+        return denied
+    keys = event_keys(str(user['_id']), user.get('role', 'patient'), request.query_params.get('patient_id'))
+    sub = event_hub.subscribe(keys, loop=asyncio.get_running_loop())
+
+    async def stream():
+        try:
+            yield SSE_PREAMBLE
+            while True:
+                event = await sub.get(EVENTS_HEARTBEAT)
+                if sub.overflowed:
+                    yield SSE_RESYNC
+                    return
+                yield sse_frame(event)
+        finally:
+            event_hub.unsubscribe(sub)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(stream(), media_type='text/event-stream', headers=headers)
+
+
+@_timed('auth', '/api/auth/me')
+async def me(request):
+    auth = request.headers.get('authorization')
+    if not auth:
+        return _json({'error': 'Authorization header required'}, 401)
+    user_id, error = decode_bearer(auth)
+    if error:
+        return _json({'error': error}, 401)
+    user = await get_async_db().users.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+    if not user:
+        return _json({'error': 'User not found'}, 404)
+    return _json({'user': user})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    model_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat/ask', ask, methods=['POST']),
+        Route('/api/chat/events', events, methods=['GET']),
+        Route('/api/auth/me', me, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    # CORS for the native routes; headers set here replace flask_cors' on bridged responses
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,201 @@
+"""Answer a JSONL file of questions offline with batched generation.
+
+    python batch_infer.py --input faq.jsonl --output faq_answers.jsonl [--workers 2] [--batch_size 16]
+
+Each input line is {"question": ..., "id": ..., "role": ..., "context": {...}}
+(only question is required; lines without an id are keyed by line number).
+Questions are read --sort_window at a time and sorted by length inside the
+window, so each padded batch holds prompts of similar length. Batches are
+answered by a pool of worker processes, each with its own copy of the model,
+and appended to --output as they finish (completion order, not input order).
+Rerun the same command after a crash: ids already in the output are skipped.
+"""
+import os
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from config import GENERATION_BATCH_SIZE
+from utils.model_loader import DECODING_PROFILES, generate_answers, load_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def read_done(path: str) -> set:
+    """ids already answered in an existing output file; a torn last line is cut off."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good = 0
+    with open(path, 'rb+') as fh:
+        for line in fh:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                done.add(str(json.loads(line)['id']))
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+        if good < fh.seek(0, os.SEEK_END):
+            logger.warning(f"Dropping an incomplete record at the end of {path}")
+            fh.truncate(good)
+    return done
+
+
+def read_items(path: str, done: set, default_role: str, counts: dict):
+    """Questions from the input file that are not answered yet."""
+    with open(path, encoding='utf-8') as fh:
+        for lineno, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                logger.warning(f"{path}:{lineno}: not valid JSON, skipped")
+                counts['invalid'] += 1
+                continue
+            question = rec.get('question') if isinstance(rec, dict) else None
+            if not question or not isinstance(question, str):
+                counts['invalid'] += 1
+                continue
+            item_id = rec.get('id', lineno)
+            if str(item_id) in done:
+                counts['resumed'] += 1
+                continue
+            context = rec.get('context')
+            yield {
+                'id': item_id,
+                'question': question,
+                'role': rec.get('role') or default_role,
+                'context': context if isinstance(context, dict) else None,
+            }
+
+
+def length_sorted_batches(items, batch_size: int, window: int):
+    """Batches of similar-length questions; sorting happens within each window of items."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, window))
+        if not chunk:
+            return
+        chunk.sort(key=lambda i: len(i['question']))
+        for i in range(0, len(chunk), batch_size):
+            yield chunk[i:i + batch_size]
+
+
+def _init_worker(threads: int):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    if not load_model():
+        raise RuntimeError("No model available (check MODEL_PATH / BASE_MODEL)")
+
+
+def answer_batch(batch: list, profile: str, use_store: bool = False) -> list:
+    """Output records for one batch; generate_answers takes one role, so mixed batches are split.
+
+    Answers come from the model unless use_store, which lets precomputed
+    answer-store entries stand in for generation.
+    """
+    by_role = {}
+    for item in batch:
+        by_role.setdefault(item['role'], []).append(item)
+    records = []
+    for role, items in by_role.items():
+        answers = generate_answers([i['question'] for i in items], role=role,
+                                   contexts=[i['context'] for i in items],
+                                   profile=profile, batch_size=len(items), precomputed=use_store)
+        records.extend({'id': i['id'], 'question': i['question'], 'role': role, 'answer': a}
+                       for i, a in zip(items, answers))
+    return records
+
+
+class Throughput:
+    def __init__(self, every: float):
+        self.every = every
+        self.started = self.last_report = time.perf_counter()
+        self.answered = 0
+        self.batches = 0
+
+    def add(self, n: int):
+        self.answered += n
+        self.batches += 1
+        now = time.perf_counter()
+        if now - self.last_report >= self.every:
+            self.last_report = now
+            self.report()
+
+    def report(self, final: bool = False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.answered / elapsed if elapsed else 0.0
+        logger.info(f"{'Done: ' if final else ''}{self.answered} answered in {self.batches} batches, "
+                    f"{elapsed:.1f}s, {rate:.2f} questions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer a JSONL file of questions with batched generation')
+    parser.add_argument('--input', type=str, required=True, help='JSONL file with one {"question": ...} per line')
+    parser.add_argument('--output', type=str, required=True, help='JSONL file answers are appended to')
+    parser.add_argument('--role', type=str, default='patient', help='Prompt role for lines without one')
+    parser.add_argument('--profile', type=str, default='default', choices=sorted(DECODING_PROFILES),
+                        help='Decoding profile')
+    parser.add_argument('--batch_size', type=int, default=GENERATION_BATCH_SIZE, help='Prompts per model.generate call')
+    parser.add_argument('--sort_window', type=int, default=4096, help='Questions sorted by length together')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, one model copy each (0: in-process)')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads per worker (0: torch default)')
+    parser.add_argument('--report_every', type=float, default=30.0, help='Seconds between throughput reports')
+    parser.add_argument('--use_answer_store', action='store_true',
+                        help='Reuse precomputed answer-store entries instead of generating (off: always generate)')
+    args = parser.parse_args()
+
+    done = read_done(args.output)
+    counts = {'invalid': 0, 'resumed': 0}
+    batches = length_sorted_batches(read_items(args.input, done, args.role, counts), args.batch_size, args.sort_window)
+    meter = Throughput(args.report_every)
+
+    with open(args.output, 'a', encoding='utf-8') as out:
+        def write(records):
+            out.write(''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in records))
+            out.flush()
+            os.fsync(out.fileno())  # a record on disk is a checkpoint
+            meter.add(len(records))
+
+        if args.workers <= 0:
+            _init_worker(args.threads)
+            for batch in batches:
+                write(answer_batch(batch, args.profile, args.use_answer_store))
+        else:
+            # spawn: CUDA cannot be used from forked workers
+            pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=(args.threads,))
+            try:
+                with pool:
+                    pending = set()
+                    for batch in batches:
+                        pending.add(pool.submit(answer_batch, batch, args.profile, args.use_answer_store))
+                        # keep every worker busy without reading the whole input ahead
+                        if len(pending) >= args.workers * 2:
+                            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for f in finished:
+                                write(f.result())
+                    for f in wait(pending).done:
+                        write(f.result())
+            except BrokenProcessPool:
+                logger.error("A worker process died (model failed to load or out of memory); "
+                             "rerun to resume from the last written batch")
+                raise
+
+    if counts['resumed']:
+        logger.info(f"Skipped {counts['resumed']} questions already in {args.output}")
+    if counts['invalid']:
+        logger.warning(f"Skipped {counts['invalid']} lines without a question")
+    meter.report(final=True)
+
+
+if __name__ == "__main__":
+    main()
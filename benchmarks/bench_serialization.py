@@ -0,0 +1,96 @@
+"""Benchmark: legacy per-document conversion + jsonify vs utils.serialization.
+
+Builds synthetic history documents shaped like /assess and /ask records and
+times the old route code path (convert _id/timestamps in a Python loop, then
+Flask's jsonify) against json_response and the streaming encoder.
+
+    python benchmarks/bench_serialization.py --docs 5000 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+from utils.serialization import json_response, stream_json_array, orjson
+
+
+def make_docs(n):
+    now = datetime.utcnow()
+    docs = []
+    for i in range(n):
+        if i % 3 == 0:
+            docs.append({
+                '_id': ObjectId(), 'user_id': str(ObjectId()), 'type': 'assessment',
+                'form': {'age': 34, 'symptoms': 'fever, headache and body ache', 'duration': '3',
+                         'allergies': 'none', 'conditions': 'asthma'},
+                'severity': 'non_urgent', 'advice': 'Rest, fluids and paracetamol. ' * 20,
+                'model_meds_raw': 'paracetamol, ibuprofen', 'suggested_meds': ['paracetamol', 'ibuprofen'],
+                'medicine_details': {'paracetamol': {'uses': ['fever', 'pain'], 'dosage': '500-1000 mg'}},
+                'created_at': now - timedelta(minutes=i),
+            })
+        else:
+            docs.append({
+                '_id': ObjectId(), 'user_id': str(ObjectId()), 'question': 'What helps with a sore throat?',
+                'answer': 'Warm fluids, honey and rest usually help. ' * 15, 'from_role': 'system',
+                'context': {'medications': ['cetirizine']}, 'timestamp': now - timedelta(minutes=i),
+            })
+    return docs
+
+
+def legacy(docs):
+    # what history()/patient_history() did before: copy, convert per document, jsonify
+    out = []
+    for d in docs:
+        d = dict(d)
+        d['_id'] = str(d['_id'])
+        for k in ('timestamp', 'created_at'):
+            if k in d and hasattr(d[k], 'isoformat'):
+                d[k] = d[k].isoformat()
+        out.append(d)
+    return jsonify({'history': out}).get_data()
+
+
+def fast(docs):
+    return json_response({'history': docs}).get_data()
+
+
+def streamed(docs):
+    return b''.join(stream_json_array('history', iter(docs)).response)
+
+
+def bench(fn, docs, repeat):
+    times = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn(docs))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON serialization of Mongo documents')
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    docs = make_docs(args.docs)
+    print(f"backend: {'orjson' if orjson else 'json (orjson not installed)'}, docs: {args.docs}")
+    with app.test_request_context():
+        fast(docs)  # warm up
+        results = [(name, *bench(fn, docs, args.repeat))
+                   for name, fn in (('legacy jsonify', legacy), ('json_response', fast), ('stream_json_array', streamed))]
+    base = results[0][1]
+    for name, t, size in results:
+        print(f"{name:<18} {t * 1000:9.2f} ms  {size / 1024:9.1f} KiB  x{base / t:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
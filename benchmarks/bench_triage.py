@@ -0,0 +1,77 @@
+"""Benchmark: triage classifier latency, one text at a time vs batched.
+
+Loads the trained classifier from TRIAGE_MODEL_PATH (or --model); without one
+it fits a throwaway model on synthetic questions so the numbers still show
+the per-call overhead.
+
+    python benchmarks/bench_triage.py --texts 2000 --batch 256
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TRIAGE_MODEL_PATH
+from utils.triage import TriageClassifier, fit_triage_model
+
+TEMPLATES = [
+    ('medication_info', 'low', 'what is the dosage of {med}'),
+    ('medication_info', 'low', 'side effects of {med}'),
+    ('symptom_check', 'medium', 'I have had a {sym} for {days} days'),
+    ('symptom_check', 'high', 'sudden {sym} and dizziness since this morning'),
+    ('emergency', 'emergency', 'severe chest pain and shortness of breath'),
+    ('general', 'low', 'how can I sleep better and reduce stress'),
+]
+MEDS = ['ibuprofen', 'cetirizine', 'omeprazole', 'paracetamol', 'loratadine']
+SYMPTOMS = ['headache', 'fever', 'sore throat', 'cough', 'rash', 'back pain']
+
+
+def make_texts(n, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        intent, urgency, t = rnd.choice(TEMPLATES)
+        rows.append((t.format(med=rnd.choice(MEDS), sym=rnd.choice(SYMPTOMS), days=rnd.randint(1, 14)), intent, urgency))
+    return rows
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=TRIAGE_MODEL_PATH)
+    parser.add_argument('--texts', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    clf = TriageClassifier(args.model)
+    if not clf.available:
+        print(f"no classifier at {args.model}; fitting one on synthetic data")
+        rows = make_texts(5000, seed=1)
+        clf = TriageClassifier(bundle=fit_triage_model(*map(list, zip(*rows))))
+    texts = [t for t, _, _ in make_texts(args.texts)]
+    clf.predict(texts[:10])  # warm up
+
+    single = timed(lambda: [clf.predict_one(t) for t in texts], args.repeat)
+    batched = timed(lambda: [clf.predict(texts[i:i + args.batch]) for i in range(0, len(texts), args.batch)],
+                    args.repeat)
+    print(f"{len(texts)} texts, median of {args.repeat} runs")
+    print(f"  predict_one          {single / len(texts) * 1e6:8.1f} us/text")
+    print(f"  predict(batch={args.batch:<4})  {batched / len(texts) * 1e6:8.1f} us/text  "
+          f"({single / batched:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Rebuild the precomputed answer store from the most frequent recent questions.
+
+    python build_answer_store.py [--top 1000] [--min_count 3] [--days 90] [--dry_run]
+
+Counts /ask questions asked without context over the last --days (normalized
+as in utils/answer_store.py, per asker role), generates answers for the --top
+most frequent per role with batched generation, and atomically replaces
+ANSWER_STORE_PATH. Run it from cron and after every model update; running
+backends pick the new file up within ANSWER_STORE_CHECK_INTERVAL.
+"""
+import time
+import argparse
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from config import (
+    ANSWER_STORE_PATH, ANSWER_STORE_TOP_N, ANSWER_STORE_MIN_COUNT, ANSWER_STORE_WINDOW_DAYS, GENERATION_BATCH_SIZE
+)
+from db.mongo import users
+from db.chat_store import chat_store
+from utils.answer_store import model_version, normalize_question, write_answer_store
+from utils.model_loader import DECODING_PROFILES, generate_answers, load_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def frequent_questions(since: datetime, top: int, min_count: int) -> dict:
+    """role -> [(count, question)] most frequent first; question is the first wording seen."""
+    roles = {str(u['_id']): u.get('role') or 'patient' for u in users.find({}, {'role': 1})}
+    counts = {}
+    wording = {}
+    scanned = 0
+    for turn in chat_store.questions(since):
+        scanned += 1
+        # catalog answers never reach the model, and context changes the answer
+        if turn.get('source') == 'catalog' or turn.get('context'):
+            continue
+        role = roles.get(str(turn.get('user_id')), 'patient')
+        norm = normalize_question(turn['question'])
+        if not norm:
+            continue
+        counts.setdefault(role, Counter())[norm] += 1
+        wording.setdefault((role, norm), turn['question'].strip())
+    logger.info(f"Scanned {scanned} turns since {since.date()}")
+    return {
+        role: [(n, wording[(role, q)]) for q, n in counter.most_common(top) if n >= min_count]
+        for role, counter in counts.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the precomputed answer store')
+    parser.add_argument('--top', type=int, default=ANSWER_STORE_TOP_N, help='Questions kept per role')
+    parser.add_argument('--min_count', type=int, default=ANSWER_STORE_MIN_COUNT, help='Minimum times asked')
+    parser.add_argument('--days', type=int, default=ANSWER_STORE_WINDOW_DAYS, help='How far back to count')
+    parser.add_argument('--output', type=str, default=ANSWER_STORE_PATH, help='Store file to replace')
+    parser.add_argument('--profile', type=str, default='default', choices=sorted(DECODING_PROFILES),
+                        help='Decoding profile for the stored answers')
+    parser.add_argument('--batch_size', type=int, default=GENERATION_BATCH_SIZE, help='Prompts per model.generate call')
+    parser.add_argument('--dry_run', action='store_true', help='Only list the questions that would be stored')
+    args = parser.parse_args()
+
+    since = datetime.utcnow() - timedelta(days=args.days)
+    top = frequent_questions(since, args.top, args.min_count)
+    total = sum(len(qs) for qs in top.values())
+    for role, qs in top.items():
+        logger.info(f"{role}: {len(qs)} questions, covering {sum(n for n, _ in qs)} asks")
+    if args.dry_run:
+        for role, qs in top.items():
+            for n, q in qs[:20]:
+                print(f"{role}\t{n}\t{q}")
+        return
+
+    if not load_model():
+        raise SystemExit("No model available (check MODEL_PATH / BASE_MODEL); store left unchanged")
+
+    started = time.perf_counter()
+    entries = []
+    for role, qs in top.items():
+        questions = sorted((q for _, q in qs), key=len)  # similar lengths pad less
+        answers = generate_answers(questions, role=role, profile=args.profile,
+                                   batch_size=args.batch_size, precomputed=False)
+        entries.extend(zip([role] * len(questions), questions, answers))
+    elapsed = time.perf_counter() - started
+    logger.info(f"Generated {total} answers in {elapsed:.1f}s")
+
+    count = write_answer_store(args.output, entries, {
+        'model_version': model_version(), 'profile': args.profile, 'days': args.days,
+    })
+    logger.info(f"Wrote {count} answers for model {model_version()} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,101 @@ DB_NAME = "healthcare_chatbot"
 SECRET_KEY = "supersecretkey"
 MODEL_PATH = "model/MyFinetunedModel"
 BASE_MODEL = "google/flan-t5-base"
+
+# Chat storage layout: 'document' (one document per turn in `chats`) or 'bucket'
+# (turns appended to per-user, per-day documents in `chat_buckets`; migrate with
+# `python migrate_chat_buckets.py`)
+CHAT_STORAGE_MODE = "document"
+CHAT_BUCKET_MAX_MESSAGES = 200
+
+# Write-behind buffering for chat/assessment inserts
+WRITE_BEHIND_ENABLED = True
+WRITE_BEHIND_BATCH_SIZE = 100
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5  # seconds
+WRITE_BEHIND_MAX_PENDING = 10000
+WRITE_BEHIND_SPOOL_DIR = "spool"
+WRITE_BEHIND_FSYNC = False
+
+# Streaming NDJSON exports
+EXPORT_BATCH_SIZE = 500  # documents per Mongo cursor batch
+
+# Live events (SSE) over change streams, with a polling fallback for standalone mongod
+EVENTS_POLL_INTERVAL = 1.0  # seconds between polls in fallback mode
+EVENTS_POLL_LAG = 5  # seconds to look back when polling (covers write-behind delay)
+EVENTS_HEARTBEAT = 15  # seconds between SSE keep-alive comments
+EVENTS_QUEUE_SIZE = 1000  # buffered events per subscriber before it is told to resync
+EVENTS_TOKEN_TTL = 60  # seconds an /events/token is valid for opening a stream (it travels in the URL)
+
+# User directory (/api/auth/users)
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 500
+COUNT_ESTIMATE_CAP = 10000  # filtered counts stop here; X-Total-Count-Estimate is a lower bound beyond it
+
+# Paged /history (?limit=&before=) and cold-tier archival of old chats
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+ARCHIVE_DIR = "archive"
+ARCHIVE_RETENTION_DAYS = 180  # turns older than this move to segment files (archive_chats.py)
+ARCHIVE_BLOCK_DOCS = 1000  # turns per compressed block in a segment
+
+# Patient history search
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Mongo client: pool bounds and timeouts (the client is created on first use, see db/mongo.py)
+MONGO_MAX_POOL_SIZE = 100
+MONGO_MIN_POOL_SIZE = 0
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 2000  # a request waiting longer than this for a connection gets a 503
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGO_CONNECT_TIMEOUT_MS = 5000
+MONGO_SOCKET_TIMEOUT_MS = 30000
+MONGO_HISTORY_READ_PREFERENCE = "primary"  # e.g. "secondaryPreferred" to move history/search reads off the primary
+MONGO_HEALTH_TIMEOUT = 2.0  # seconds allowed for the /health ping
+
+# Async serving mode (asgi.py)
+ASYNC_MODEL_WORKERS = 2  # threads running model generation; requests beyond this queue without holding a thread
+
+# Admission control for model-backed endpoints (/ask, /assess); see utils/admission.py
+MODEL_CONCURRENCY = 2  # generations allowed to run at once; the rest wait their turn
+ADMISSION_MAX_QUEUE = 32  # admitted model requests (running + waiting) before new ones get a 503
+ADMISSION_MAX_WAIT = 30.0  # seconds of estimated queueing before new requests get a 503
+ADMISSION_PER_USER_CONCURRENCY = 2
+ADMISSION_RATE = 0.2  # model requests per second per user (token refill)
+ADMISSION_BURST = 5
+ADMISSION_INITIAL_SERVICE_TIME = 5.0  # seconds per model request assumed until measured
+ADMISSION_CRITICAL_RESERVE = 8  # queue places beyond ADMISSION_MAX_QUEUE only critical requests may take
+
+# Priority scheduling of model generations (utils/scheduler.py)
+SCHEDULER_WEIGHTS = {'critical': 8, 'urgent': 4, 'routine': 1}  # share of model slots when all classes wait
+SCHEDULER_AGING_RATE = 0.1  # virtual-time credit per second waited (a routine request beats fresh critical ones after ~9s)
+
+# Intent/urgency triage classifier (train with `python train_triage.py`; optional, rules apply without it)
+TRIAGE_MODEL_PATH = "model/triage_classifier.joblib"
+TRIAGE_MIN_CONFIDENCE = 0.6  # predictions below this probability are ignored
+# urgency_level labels that raise severity / scheduling priority
+TRIAGE_URGENCY_SEVERITY = {'emergency': 'critical', 'critical': 'critical', 'high': 'urgent', 'urgent': 'urgent'}
+TRIAGE_CATALOG_INTENTS = ('medication_info', 'medication_query', 'drug_information')  # user_intent labels the catalog may answer
+TRIAGE_BRIEF_INTENTS = ('greeting', 'general', 'general_info')  # answered with the shorter 'brief' decoding profile
+
+# Bulk triage (/api/chat/triage/bulk)
+BULK_TRIAGE_MAX_ROWS = 5000
+BULK_TRIAGE_MAX_ADVICE_ROWS = 500  # rows that may request generated advice in one upload
+GENERATION_BATCH_SIZE = 8  # prompts per model.generate call in generate_answers
+
+# Batched questions (/api/chat/ask/batch)
+ASK_BATCH_MAX_ITEMS = 32
+
+# Precomputed answers for frequent questions (build with `python build_answer_store.py`; utils/answer_store.py)
+ANSWER_STORE_PATH = "model/answer_store.bin"
+ANSWER_STORE_CHECK_INTERVAL = 30.0  # seconds between checks for a rebuilt store file
+ANSWER_STORE_TOP_N = 1000  # most frequent questions kept per role
+ANSWER_STORE_MIN_COUNT = 3  # asked at least this often in the window
+ANSWER_STORE_WINDOW_DAYS = 90
+
+# Request tracing (utils/tracing.py): Server-Timing header and slow-request log
+TRACE_ENABLED = True
+TRACE_SERVER_TIMING = False  # debug only: send span timings (collection names, model timings) to every client
+TRACE_SERVER_TIMING_ROLES = ('doctor',)  # authenticated roles that get the Server-Timing header regardless
+TRACE_SLOW_REQUEST_MS = 2000  # requests slower than this are logged with their spans
+TRACE_SLOW_SAMPLE_RATE = 1.0  # fraction of slow requests logged
+TRACE_MAX_SPANS = 200  # per request; further spans are counted, not kept
@@ -0,0 +1,25 @@
+"""Create the collection indexes and backfill name_lower on older users.
+
+    python create_indexes.py
+
+Run once per deployment (and after upgrades that add indexes) before starting
+the app; importing the app never touches Mongo. Safe to re-run: existing
+indexes are left alone. Exits 1 if any step failed.
+"""
+import sys
+import logging
+from db.indexes import ensure_indexes
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    if not ensure_indexes():
+        logger.error("Some indexes could not be created; see the warnings above")
+        sys.exit(1)
+    logger.info("Indexes are in place")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Cold tier for old chats: compressed, append-only segment files on local disk.
+
+`archive_chats.py` moves turns older than ARCHIVE_RETENTION_DAYS out of Mongo
+into segment files under ARCHIVE_DIR, keeping the hot working set small.
+
+    ARCHIVE_DIR/segments/<name>.seg   concatenated gzip members, each one block of
+                                      NDJSON (canonical Extended JSON) for one user
+    ARCHIVE_DIR/index.jsonl           one line per block: user_id, segment, offset,
+                                      length, count, first/last _id
+
+A block can be read with one seek and one decompress, so a user's archived
+history is found through the index without scanning other users' data. Blocks
+are written and fsync'd before the turns are deleted from Mongo; if a run dies
+in between, the next run archives them again and readers drop the duplicates.
+"""
+import os
+import gzip
+import json
+import logging
+import threading
+from datetime import datetime
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from bson.objectid import ObjectId
+from config import ARCHIVE_DIR, ARCHIVE_BLOCK_DOCS
+
+log = logging.getLogger(__name__)
+
+
+class ChatArchive:
+    def __init__(self, root: str):
+        self.root = root
+        self.segment_dir = os.path.join(root, 'segments')
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self._lock = threading.Lock()
+        self._index = {}  # user_id -> [entry], oldest block first
+        self._index_stamp = None
+
+    # -- index ------------------------------------------------------------
+
+    def _entries(self, user_id: str) -> list:
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return []
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp != self._index_stamp:
+                index = {}
+                with open(self.index_path, encoding='utf-8') as fh:
+                    for line in fh:
+                        try:
+                            e = json.loads(line)
+                        except ValueError:
+                            continue  # torn line from an interrupted run
+                        e['first'] = ObjectId(e['first'])
+                        e['last'] = ObjectId(e['last'])
+                        index.setdefault(e['user_id'], []).append(e)
+                for entries in index.values():
+                    entries.sort(key=lambda e: e['first'])
+                self._index = index
+                self._index_stamp = stamp
+            return self._index.get(user_id, [])
+
+    def has(self, user_id: str) -> bool:
+        return bool(self._entries(user_id))
+
+    # -- reading ----------------------------------------------------------
+
+    def _read_block(self, entry: dict) -> list:
+        with open(os.path.join(self.segment_dir, entry['segment']), 'rb') as fh:
+            fh.seek(entry['offset'])
+            data = gzip.decompress(fh.read(entry['length']))
+        return [json_util.loads(line) for line in data.splitlines() if line]
+
+    def iter_user(self, user_id: str):
+        """Archived turns of user_id, oldest first."""
+        seen = set()
+        for entry in self._entries(user_id):
+            for doc in self._read_block(entry):
+                if doc['_id'] not in seen:
+                    seen.add(doc['_id'])
+                    yield doc
+
+    def iter_user_desc(self, user_id: str, before=None):
+        """Archived turns of user_id newest first, optionally only _id < before."""
+        seen = set()
+        for entry in sorted(self._entries(user_id), key=lambda e: e['last'], reverse=True):
+            if before is not None and entry['first'] >= before:
+                continue
+            for doc in reversed(self._read_block(entry)):
+                if (before is None or doc['_id'] < before) and doc['_id'] not in seen:
+                    seen.add(doc['_id'])
+                    yield doc
+
+    # -- writing ----------------------------------------------------------
+
+    def archive_expired(self, store, cutoff: datetime, block_docs: int = ARCHIVE_BLOCK_DOCS,
+                        dry_run: bool = False) -> int:
+        """Move turns older than cutoff from store into a new segment. Returns the count moved."""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        name = f"seg-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{os.getpid()}.seg"
+        path = os.path.join(self.segment_dir, name)
+        moved = 0
+        with open(path, 'ab') as seg:
+            for user_id, docs, handles in store.expired(cutoff, block_docs):
+                if not docs:
+                    if not dry_run:
+                        store.purge(handles)  # empty buckets left behind by deletes
+                    continue
+                moved += len(docs)
+                if dry_run:
+                    continue
+                docs.sort(key=lambda d: d['_id'])
+                payload = b''.join(
+                    json_util.dumps(d, json_options=CANONICAL_JSON_OPTIONS).encode('utf-8') + b'\n' for d in docs
+                )
+                offset = seg.tell()
+                seg.write(gzip.compress(payload))
+                seg.flush()
+                os.fsync(seg.fileno())
+                entry = {
+                    'user_id': user_id, 'segment': name, 'offset': offset,
+                    'length': seg.tell() - offset, 'count': len(docs),
+                    'first': str(docs[0]['_id']), 'last': str(docs[-1]['_id']),
+                }
+                with open(self.index_path, 'a', encoding='utf-8') as idx:
+                    idx.write(json.dumps(entry) + '\n')
+                    idx.flush()
+                    os.fsync(idx.fileno())
+                # only now is it safe to drop the hot copy
+                store.purge(handles)
+        if not moved or dry_run:
+            os.remove(path)
+        return moved
+
+
+chat_archive = ChatArchive(ARCHIVE_DIR)
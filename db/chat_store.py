@@ -0,0 +1,297 @@
+"""Storage layouts for chat turns and assessments.
+
+`document` mode keeps one Mongo document per turn in `chats` (the original
+layout). `bucket` mode appends turns into per-user, per-day bucket documents
+in `chat_buckets`, capped at CHAT_BUCKET_MAX_MESSAGES turns each, so reading a
+month of history is a handful of document fetches. Each turn keeps its own
+_id inside the bucket, so message ids, edits and deletes work the same way.
+Routes and the write-behind buffer only talk to `chat_store`.
+"""
+import re
+from datetime import datetime
+from itertools import groupby, islice
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, TEXT, UpdateOne
+from pymongo.errors import BulkWriteError
+from config import CHAT_STORAGE_MODE, CHAT_BUCKET_MAX_MESSAGES
+from db.mongo import db, chats, history_reads
+from utils.search import SEARCH_FIELDS, parse_query, matches
+
+DUPLICATE_KEY_ERROR = 11000
+TEXT_INDEX_WEIGHTS = {'question': 3, 'form.symptoms': 3, 'advice': 1, 'answer': 1}
+_PUSHED_MESSAGE = re.compile(r'^messages\.(\d+)$')
+_EDITED_MESSAGE = re.compile(r'^messages\.(\d+)\.')
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    return all(doc.get(k) == v for k, v in query.items())
+
+
+def _message_day(doc: dict) -> str:
+    # the _id is assigned when the request is served (see write_behind), so it dates the turn
+    return doc['_id'].generation_time.strftime('%Y-%m-%d')
+
+
+class DocumentChatStore:
+    """One document per turn in `chats`."""
+
+    mode = 'document'
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection_name = collection.name
+
+    def ensure_indexes(self):
+        self.collection.create_index([('user_id', ASCENDING), ('timestamp', ASCENDING)])
+        self.collection.create_index([('user_id', ASCENDING), ('_id', ASCENDING)])
+        # user_id prefix: every search is scoped to one patient, so only their entries are scanned
+        self.collection.create_index(
+            [('user_id', ASCENDING)] + [(f, TEXT) for f in SEARCH_FIELDS],
+            name='chat_text', weights=TEXT_INDEX_WEIGHTS, default_language='english'
+        )
+
+    def insert_many(self, docs: list):
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # a replayed document may already be stored; anything else is a real failure
+            errors = e.details.get('writeErrors', [])
+            if any(err.get('code') != DUPLICATE_KEY_ERROR for err in errors):
+                raise
+
+    def history(self, user_id: str, projection=None, order: str = 'timestamp', batch_size: int = 0):
+        cursor = history_reads(self.collection).find({'user_id': user_id}, projection).sort(order, 1)
+        return cursor.batch_size(batch_size) if batch_size else cursor
+
+    def history_desc(self, user_id: str, before=None, projection=None):
+        """Turns of user_id newest first, optionally only those with _id < before."""
+        query = {'user_id': user_id}
+        if before is not None:
+            query['_id'] = {'$lt': before}
+        return history_reads(self.collection).find(query, projection).sort('_id', -1)
+
+    def find_one(self, query: dict):
+        return self.collection.find_one(query)
+
+    def search(self, user_id: str, text_query: str, limit: int):
+        """Turns of user_id matching a $text query, best first, each with a `score`."""
+        return history_reads(self.collection).find(
+            {'user_id': user_id, '$text': {'$search': text_query}},
+            {'score': {'$meta': 'textScore'}}
+        ).sort([('score', {'$meta': 'textScore'})]).limit(limit)
+
+    def update_fields(self, _id, fields: dict):
+        self.collection.update_one({'_id': _id}, {'$set': fields})
+
+    def delete(self, _id):
+        self.collection.delete_one({'_id': _id})
+
+    def recent(self, floor_id, since: datetime):
+        """Turns stored with an _id above floor_id (used by the event poller)."""
+        return self.collection.find({'_id': {'$gt': floor_id}}).sort('_id', 1)
+
+    def questions(self, since: datetime):
+        """/ask turns stored since `since` (user_id, question, context, source), for answer-store mining."""
+        return self.collection.find(
+            {'_id': {'$gte': ObjectId.from_datetime(since)}, 'question': {'$type': 'string'}},
+            {'user_id': 1, 'question': 1, 'context': 1, 'source': 1}
+        ).batch_size(1000)
+
+    def expired(self, cutoff: datetime, block_docs: int):
+        """(user_id, turns, handles) blocks of turns older than cutoff, for archival."""
+        cursor = self.collection.find({'_id': {'$lt': ObjectId.from_datetime(cutoff)}}).sort(
+            [('user_id', 1), ('_id', 1)])
+        for user_id, group in groupby(cursor, key=lambda d: d.get('user_id')):
+            while True:
+                block = list(islice(group, block_docs))
+                if not block:
+                    break
+                yield user_id, block, [d['_id'] for d in block]
+
+    def purge(self, handles: list):
+        self.collection.delete_many({'_id': {'$in': handles}})
+
+    def messages_from_change(self, change: dict):
+        """(kind, doc) pairs described by a change-stream event on this collection."""
+        doc = change.get('fullDocument')
+        if doc:
+            yield ('created' if change['operationType'] == 'insert' else 'updated'), doc
+
+
+class BucketChatStore:
+    """Turns appended to per-user, per-day bucket documents in `chat_buckets`."""
+
+    mode = 'bucket'
+
+    def __init__(self, collection, max_messages: int):
+        self.collection = collection
+        self.collection_name = collection.name
+        self.max_messages = max_messages
+
+    def ensure_indexes(self):
+        self.collection.create_index([('user_id', ASCENDING), ('day', ASCENDING), ('count', ASCENDING)])
+        self.collection.create_index([('messages._id', ASCENDING)])
+        self.collection.create_index([('updated_at', ASCENDING)])
+        self.collection.create_index(
+            [('user_id', ASCENDING)] + [(f'messages.{f}', TEXT) for f in SEARCH_FIELDS],
+            name='chat_text', default_language='english',
+            weights={f'messages.{f}': w for f, w in TEXT_INDEX_WEIGHTS.items()}
+        )
+
+    def insert_many(self, docs: list):
+        if not docs:
+            return
+        # replays of the write-behind spool must not append a turn twice
+        ids = [d['_id'] for d in docs]
+        stored = set()
+        for b in self.collection.find({'messages._id': {'$in': ids}}, {'messages._id': 1}):
+            stored.update(m['_id'] for m in b.get('messages', []))
+        docs = [d for d in docs if d['_id'] not in stored]
+
+        now = datetime.utcnow()
+        ops = []
+        keyed = sorted(docs, key=lambda d: (str(d.get('user_id')), _message_day(d), d['_id']))
+        for (user_id, day), group in groupby(keyed, key=lambda d: (str(d.get('user_id')), _message_day(d))):
+            group = list(group)
+            for i in range(0, len(group), self.max_messages):
+                chunk = group[i:i + self.max_messages]
+                ops.append(UpdateOne(
+                    {'user_id': chunk[0].get('user_id'), 'day': day,
+                     'count': {'$lte': self.max_messages - len(chunk)}},
+                    {'$push': {'messages': {'$each': chunk}},
+                     '$inc': {'count': len(chunk)},
+                     '$set': {'updated_at': now},
+                     '$setOnInsert': {'start': chunk[0]['_id'].generation_time.replace(tzinfo=None)}},
+                    upsert=True
+                ))
+        if ops:
+            self.collection.bulk_write(ops, ordered=True)
+
+    def history(self, user_id: str, projection=None, order: str = 'timestamp', batch_size: int = 0):
+        # turns come back in insertion order (buckets by day, then position); `order` only
+        # matters for the document layout, where it picks the index to sort on
+        bucket_projection = {'messages': 1}
+        if projection:
+            bucket_projection = {f'messages.{f}': 1 for f in projection}
+            bucket_projection['messages._id'] = 1
+        cursor = history_reads(self.collection).find({'user_id': user_id}, bucket_projection).sort(
+            [('day', 1), ('_id', 1)])
+        if batch_size:
+            cursor = cursor.batch_size(max(1, batch_size // self.max_messages))
+        for bucket in cursor:
+            yield from bucket.get('messages', [])
+
+    def history_desc(self, user_id: str, before=None, projection=None):
+        """Turns of user_id newest first, optionally only those with _id < before."""
+        bucket_projection = {'messages': 1}
+        if projection:
+            bucket_projection = {f'messages.{f}': 1 for f in projection}
+            bucket_projection['messages._id'] = 1
+        query = {'user_id': user_id}
+        if before is not None:
+            query['day'] = {'$lte': before.generation_time.strftime('%Y-%m-%d')}
+        cursor = history_reads(self.collection).find(query, bucket_projection).sort([('day', -1), ('_id', -1)])
+        for bucket in cursor:
+            for m in reversed(bucket.get('messages', [])):
+                if before is None or m['_id'] < before:
+                    yield m
+
+    def search(self, user_id: str, text_query: str, limit: int):
+        """Matching turns of user_id; the text index finds buckets, turns are then filtered in Python."""
+        terms, excluded = parse_query(text_query)
+        cursor = history_reads(self.collection).find(
+            {'user_id': user_id, '$text': {'$search': text_query}},
+            {'messages': 1, 'score': {'$meta': 'textScore'}}
+        ).sort([('score', {'$meta': 'textScore'})])
+        found = 0
+        for bucket in cursor:
+            for m in reversed(bucket.get('messages', [])):
+                if matches(m, terms, excluded):
+                    m['score'] = bucket['score']
+                    yield m
+                    found += 1
+                    if found >= limit:
+                        return
+
+    def find_one(self, query: dict):
+        bucket = self.collection.find_one({'messages._id': query['_id']},
+                                          {'messages': {'$elemMatch': {'_id': query['_id']}}})
+        if not bucket or not bucket.get('messages'):
+            return None
+        doc = bucket['messages'][0]
+        return doc if _matches(doc, query) else None
+
+    def update_fields(self, _id, fields: dict):
+        update = {f'messages.$.{k}': v for k, v in fields.items()}
+        update['updated_at'] = datetime.utcnow()
+        self.collection.update_one({'messages._id': _id}, {'$set': update})
+
+    def delete(self, _id):
+        self.collection.update_one({'messages._id': _id},
+                                   {'$pull': {'messages': {'_id': _id}}, '$inc': {'count': -1}})
+
+    def recent(self, floor_id, since: datetime):
+        for bucket in self.collection.find({'updated_at': {'$gt': since}}, {'messages': 1}):
+            for m in bucket.get('messages', []):
+                if m['_id'] > floor_id:
+                    yield m
+
+    def questions(self, since: datetime):
+        fields = ('user_id', 'question', 'context', 'source')
+        cursor = self.collection.find({'day': {'$gte': since.strftime('%Y-%m-%d')}},
+                                      {f'messages.{f}': 1 for f in fields})
+        for bucket in cursor.batch_size(50):
+            for m in bucket.get('messages', []):
+                if isinstance(m.get('question'), str):
+                    yield m
+
+    def expired(self, cutoff: datetime, block_docs: int):
+        # whole buckets only: a bucket is archived once its day is before the cutoff day
+        cursor = self.collection.find({'day': {'$lt': cutoff.strftime('%Y-%m-%d')}}).sort(
+            [('user_id', 1), ('day', 1), ('_id', 1)])
+        for user_id, group in groupby(cursor, key=lambda b: b.get('user_id')):
+            block, handles = [], []
+            for bucket in group:
+                block.extend(bucket.get('messages', []))
+                handles.append(bucket['_id'])
+                if len(block) >= block_docs:
+                    yield user_id, block, handles
+                    block, handles = [], []
+            if handles:
+                yield user_id, block, handles
+
+    def purge(self, handles: list):
+        self.collection.delete_many({'_id': {'$in': handles}})
+
+    def messages_from_change(self, change: dict):
+        bucket = change.get('fullDocument') or {}
+        messages = bucket.get('messages', [])
+        if change['operationType'] != 'update':
+            for m in messages:
+                yield 'created', m
+            return
+        updated = change.get('updateDescription', {}).get('updatedFields', {})
+        edited_positions = set()
+        for key, value in updated.items():
+            # a whole-array 'messages' entry comes from $pull (a delete); nothing to announce
+            pushed = _PUSHED_MESSAGE.match(key)
+            if pushed:
+                yield 'created', value
+                continue
+            edited = _EDITED_MESSAGE.match(key)
+            if edited:
+                edited_positions.add(int(edited.group(1)))
+        for pos in sorted(edited_positions):
+            if pos < len(messages):
+                yield 'updated', messages[pos]
+
+
+def make_chat_store(mode: str = CHAT_STORAGE_MODE):
+    if mode == 'bucket':
+        return BucketChatStore(db.chat_buckets, CHAT_BUCKET_MAX_MESSAGES)
+    if mode != 'document':
+        raise ValueError(f"Unknown CHAT_STORAGE_MODE: {mode}")
+    return DocumentChatStore(chats)
+
+
+chat_store = make_chat_store()
@@ -0,0 +1,49 @@
+"""Index definitions, created once at startup (create_index is a no-op when present)."""
+import logging
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from db.mongo import users, appointments, triage_results
+from db.chat_store import chat_store
+
+log = logging.getLogger(__name__)
+
+USER_INDEXES = [
+    # directory search: prefix match, then ordered by the matched key and _id (see routes/auth.list_users)
+    [('name_lower', ASCENDING), ('_id', ASCENDING)],
+    [('email', ASCENDING), ('_id', ASCENDING)],
+    [('role', ASCENDING), ('_id', ASCENDING)],
+    [('role', ASCENDING), ('name_lower', ASCENDING), ('_id', ASCENDING)],
+    [('role', ASCENDING), ('email', ASCENDING), ('_id', ASCENDING)],
+]
+
+
+def _backfill_name_lower():
+    # users created before the directory search existed have no name_lower
+    res = users.update_many(
+        {'name_lower': {'$exists': False}, 'name': {'$type': 'string'}},
+        [{'$set': {'name_lower': {'$toLower': '$name'}}}]
+    )
+    if res.modified_count:
+        log.info(f"Backfilled name_lower on {res.modified_count} users")
+
+
+def _steps():
+    for keys in USER_INDEXES:
+        yield f"users index {keys}", lambda keys=keys: users.create_index(keys)
+    yield "chat indexes", chat_store.ensure_indexes
+    yield "triage_results index", lambda: triage_results.create_index([('batch_id', ASCENDING)])
+    # the /events polling fallback (utils/events.py) queries updated_at every EVENTS_POLL_INTERVAL
+    yield "appointments index", lambda: appointments.create_index([('updated_at', ASCENDING)])
+    yield "name_lower backfill", _backfill_name_lower
+
+
+def ensure_indexes() -> bool:
+    """Run every step; one failing (e.g. a conflicting existing index) does not skip the others."""
+    ok = True
+    for name, step in _steps():
+        try:
+            step()
+        except PyMongoError as e:
+            log.warning(f"Could not ensure {name}: {e}")
+            ok = False
+    return ok
@@ -1,9 +1,234 @@
-from pymongo import MongoClient
-from config import MONGO_URI, DB_NAME
+"""Shared Mongo client, created on first use.
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+Importing this module does not connect: `db` and the collection handles are
+lightweight proxies, and the MongoClient (with the pool size and timeouts from
+config) is built the first time one of them is actually used. Scripts and
+workers that never touch the database never open a connection.
 
-users = db.users
-chats = db.chats
-appointments = db.appointments
+Pool activity is tracked by `pool_stats` (a pymongo ConnectionPoolListener);
+`health()` pings the server with a short deadline and reports it together with
+the pool numbers.
+"""
+import time
+import logging
+import threading
+import pymongo
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from utils import metrics, tracing
+from config import (
+    MONGO_URI, DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_HISTORY_READ_PREFERENCE, MONGO_HEALTH_TIMEOUT, TRACE_ENABLED
+)
+
+log = logging.getLogger(__name__)
+
+HISTORY_READ_PREFERENCE = make_read_preference(read_pref_mode_from_name(MONGO_HISTORY_READ_PREFERENCE), None)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Counters for the connection pools (all servers, sync and async clients combined)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_errors = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'max_pool_size': MONGO_MAX_POOL_SIZE,
+                'open': self.open,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'utilization': round(self.in_use / MONGO_MAX_POOL_SIZE, 3) if MONGO_MAX_POOL_SIZE else None,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'checkout_errors': self.checkout_errors,
+                'avg_wait_ms': round(self._total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        wait_ms = event.duration * 1000
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            self.in_use += 1
+            self.checkouts += 1
+            self._total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            else:
+                self.checkout_errors += 1
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            log.warning(f"Mongo pool exhausted: no connection within {MONGO_WAIT_QUEUE_TIMEOUT_MS}ms")
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    # lifecycle events that don't change the counters
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+class CommandTimings(monitoring.CommandListener):
+    """Round-trip time of every Mongo command, per collection (utils/metrics.py histogram and trace spans)."""
+
+    def __init__(self):
+        self._collections = {}  # (connection_id, request_id) -> collection of a running command
+
+    def started(self, event):
+        name = event.command_name
+        coll = event.command.get('collection' if name == 'getMore' else name)
+        self._collections[(event.connection_id, event.request_id)] = coll if isinstance(coll, str) else '-'
+
+    def _finished(self, event, outcome):
+        coll = self._collections.pop((event.connection_id, event.request_id), '-')
+        seconds = event.duration_micros / 1e6
+        metrics.MONGO_LATENCY.labels(coll, event.command_name, outcome).observe(seconds)
+        # listeners run on the thread that issued the command, so this lands in that request's trace
+        tracing.record(f'mongo.{coll}.{event.command_name}', seconds, **({'error': True} if outcome == 'error' else {}))
+
+    def succeeded(self, event):
+        self._finished(event, 'ok')
+
+    def failed(self, event):
+        self._finished(event, 'error')
+
+
+pool_stats = PoolStats()
+command_timings = CommandTimings()
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    return {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS,
+        'event_listeners': [pool_stats, command_timings] if metrics.enabled or TRACE_ENABLED else [pool_stats],
+    }
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, **_client_options())
+    return _client
+
+
+def set_client(client):
+    """Use an already constructed client (e.g. a test double) instead of MONGO_URI."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def get_async_db():
+    """Database handle on pymongo's asyncio client, for the ASGI server (asgi.py).
+
+    The async client is bound to the event loop it is first used from.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncMongoClient(MONGO_URI, **_client_options())
+    return _async_client[DB_NAME]
+
+
+class _Lazy:
+    """Stands in for a Database/Collection and resolves it on first attribute access."""
+
+    def __init__(self, resolve, name):
+        self._resolve = resolve
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __repr__(self):
+        return f"<lazy {self.name}>"
+
+
+def _collection(name):
+    return _Lazy(lambda: get_db()[name], name)
+
+
+db = _Lazy(get_db, DB_NAME)
+users = _collection('users')
+chats = _collection('chats')
+appointments = _collection('appointments')
+triage_results = _collection('triage_results')
+
+
+def history_reads(collection):
+    """collection with the read preference configured for history/search/export reads."""
+    return collection.with_options(read_preference=HISTORY_READ_PREFERENCE)
+
+
+def health() -> dict:
+    """Ping the server within MONGO_HEALTH_TIMEOUT seconds; never raises."""
+    started = time.perf_counter()
+    status = {'ok': False}
+    try:
+        with pymongo.timeout(MONGO_HEALTH_TIMEOUT):
+            get_client().admin.command('ping')
+        status['ok'] = True
+    except PyMongoError as e:
+        status['error'] = str(e)
+    status['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    status['pool'] = pool_stats.snapshot()
+    return status
@@ -0,0 +1,274 @@
+"""Write-behind buffering for inserts that sit on the request path.
+
+Documents get a client-side ObjectId, are appended to a local spool file and
+acknowledged straight away; a background thread hands them to the sink's
+insert_many once a batch fills up or the flush interval elapses. Spool files
+left behind by a crashed process are replayed on the next start. Replays are
+idempotent because the _ids are fixed up front and the sink skips documents
+it already stored.
+"""
+import os
+import glob
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+from config import (
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_SPOOL_DIR, WRITE_BEHIND_FSYNC
+)
+from db.chat_store import chat_store
+from utils.tracing import span
+
+log = logging.getLogger(__name__)
+
+MAX_RETRY_BACKOFF = 30.0  # seconds
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False
+    if os.name == 'nt':
+        # os.kill(pid, 0) would signal the process on Windows; assume the
+        # owner is gone (the dev server runs a single process there anyway)
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindBuffer:
+    """Buffers inserts for one sink (anything with insert_many) and flushes them in batches."""
+
+    def __init__(self, sink, name, spool_dir, batch_size=100, flush_interval=0.5,
+                 max_pending=10000, fsync=False, enabled=True):
+        self.sink = sink
+        self.name = name
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.enabled = enabled
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = OrderedDict()   # _id -> doc, not yet handed to Mongo
+        self._inflight = OrderedDict()  # _id -> doc, currently being flushed
+        self._spool = None
+        self._spool_seq = 0
+        self._sealed = []  # rotated spool files whose docs are not confirmed yet
+        self._thread = None
+        self._closed = False
+
+    # -- public API -------------------------------------------------------
+
+    def insert(self, doc: dict) -> ObjectId:
+        """Queue a document for insertion and return its (client-side) _id."""
+        doc.setdefault('_id', ObjectId())
+        if not self.enabled:
+            self.sink.insert_many([doc])
+            return doc['_id']
+
+        with span('write_behind'), self._cond:  # includes waiting for the lock / a full buffer
+            self._start()
+            # bounded memory: if Mongo is down for long, callers wait for the flusher
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.notify_all()
+                self._cond.wait(self.flush_interval)
+            self._write_spool([doc])
+            self._pending[doc['_id']] = doc
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return doc['_id']
+
+    def insert_many(self, docs: list) -> list:
+        """Queue several documents with one spool write; returns their _ids in order."""
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+        if not self.enabled:
+            if docs:
+                self.sink.insert_many(docs)
+            return [d['_id'] for d in docs]
+
+        with span('write_behind'), self._cond:
+            self._start()
+            while len(self._pending) + len(docs) > max(self.max_pending, len(docs)) and not self._closed:
+                self._cond.notify_all()
+                self._cond.wait(self.flush_interval)
+            self._write_spool(docs)
+            for doc in docs:
+                self._pending[doc['_id']] = doc
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return [d['_id'] for d in docs]
+
+    def get(self, _id):
+        """Return a copy of a buffered (not yet confirmed) document, if any."""
+        with self._cond:
+            self._start()
+            doc = self._pending.get(_id) or self._inflight.get(_id)
+            return dict(doc) if doc else None
+
+    def pending_for(self, user_id: str) -> list:
+        """Copies of buffered documents owned by user_id, oldest first."""
+        with self._cond:
+            self._start()
+            docs = list(self._inflight.values()) + list(self._pending.values())
+            return [dict(d) for d in docs if d.get('user_id') == user_id]
+
+    def flush(self) -> bool:
+        """Write everything buffered so far. Returns False if Mongo refused it."""
+        if not self.enabled:
+            return True
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return True
+                batch = list(self._pending.values())
+                self._inflight.update(self._pending)
+                self._pending.clear()
+                self._rotate_spool()
+
+            ok = self._write(batch)
+
+            with self._cond:
+                if ok:
+                    for d in batch:
+                        self._inflight.pop(d['_id'], None)
+                    done, self._sealed = self._sealed, []
+                else:
+                    # put the batch back in front of anything queued meanwhile
+                    requeue = OrderedDict((d['_id'], d) for d in batch)
+                    for d in batch:
+                        self._inflight.pop(d['_id'], None)
+                    requeue.update(self._pending)
+                    self._pending = requeue
+                    done = []
+                self._cond.notify_all()
+
+        for path in done:
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning(f"Could not remove spool file {path}: {e}")
+        return ok
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval * 4)
+        self.flush()
+        with self._cond:
+            if self._spool:
+                self._spool.close()
+                self._spool = None
+
+    # -- internals --------------------------------------------------------
+
+    def _start(self):
+        # caller holds self._cond
+        if self._thread is not None:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _spool_path(self, pid, seq):
+        return os.path.join(self.spool_dir, f"{self.name}.{pid}.{seq}.spool")
+
+    def _write_spool(self, docs):
+        if self._spool is None:
+            self._spool_seq += 1
+            path = self._spool_path(os.getpid(), self._spool_seq)
+            while os.path.exists(path):
+                # left by an earlier process that had our pid; it is replayed separately
+                self._spool_seq += 1
+                path = self._spool_path(os.getpid(), self._spool_seq)
+            self._spool = open(path, 'a', encoding='utf-8')
+        self._spool.write(''.join(json_util.dumps(d, json_options=CANONICAL_JSON_OPTIONS) + '\n' for d in docs))
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+
+    def _rotate_spool(self):
+        if self._spool is not None:
+            self._sealed.append(self._spool.name)
+            self._spool.close()
+            self._spool = None
+
+    def _replay(self):
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f"{self.name}.*.spool"))):
+            try:
+                pid = int(os.path.basename(path).split('.')[-3])
+            except (ValueError, IndexError):
+                continue
+            if _pid_alive(pid):
+                continue
+            with open(path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        doc = json_util.loads(line)
+                    except Exception:
+                        # torn last line from the crash; the document was never acknowledged
+                        continue
+                    if doc.get('_id') not in self._pending:
+                        self._pending[doc['_id']] = doc
+                        recovered += 1
+            self._sealed.append(path)
+        if recovered:
+            log.info(f"Recovered {recovered} spooled {self.name} documents")
+
+    def _write(self, batch) -> bool:
+        try:
+            for i in range(0, len(batch), self.batch_size):
+                self.sink.insert_many(batch[i:i + self.batch_size])
+            return True
+        except PyMongoError as e:
+            log.warning(f"Write-behind flush of {len(batch)} {self.name} documents failed: {e}")
+            return False
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                # Mongo is struggling; back off instead of retrying on every insert
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+
+
+chat_writer = WriteBehindBuffer(
+    chat_store,
+    name='chats',
+    spool_dir=WRITE_BEHIND_SPOOL_DIR,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+    max_pending=WRITE_BEHIND_MAX_PENDING,
+    fsync=WRITE_BEHIND_FSYNC,
+    enabled=WRITE_BEHIND_ENABLED,
+)
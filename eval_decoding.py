@@ -0,0 +1,243 @@
+"""Sweep decoding configurations: answer quality (ROUGE, length) against CPU latency.
+
+    python eval_decoding.py --csv_path healthcare_chatbot_dataset_large.csv --eval_samples 200 [--min_rouge_l 0.3]
+
+Runs every configuration of the grid (DECODING_PROFILES plus greedy/beam
+variants, or --configs <file.json> with [{"name": ..., "generate": {...}}])
+over the first --eval_samples examples of the held-out test split from
+HealthcareChatDataset.prepare_for_training, one example per generate call as
+/ask does. Results are cached per (model, data, config) under --cache_dir, so
+adding a configuration to the grid only runs that one. Prints every config
+with the latency/ROUGE-L Pareto frontier marked and writes the full report to
+--output; with --min_rouge_l it also names the fastest config meeting that bar.
+
+ROUGE here is F1 over lowercase word tokens without stemming, so numbers are
+comparable between runs of this script but not to other ROUGE packages.
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import logging
+import statistics
+from itertools import product
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from config import MODEL_PATH, BASE_MODEL
+from utils.answer_store import model_fingerprint
+from utils.model_loader import DECODING_PROFILES
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'\w+')
+
+
+def default_grid():
+    configs = [{'name': f'profile:{name}', 'generate': dict(params)} for name, params in DECODING_PROFILES.items()]
+    for beams, max_new, penalty in product((1, 2, 4), (128, 256), (1.0, 1.3, 1.8)):
+        configs.append({
+            'name': f"beams{beams}-new{max_new}-rep{penalty}",
+            'generate': dict(num_beams=beams, do_sample=False, max_new_tokens=max_new, repetition_penalty=penalty,
+                             no_repeat_ngram_size=4, early_stopping=beams > 1),
+        })
+    return configs
+
+
+# -- metrics ---------------------------------------------------------------
+
+def _tokens(text):
+    return _WORD.findall(text.lower())
+
+
+def _ngrams(tokens, n):
+    grams = {}
+    for i in range(len(tokens) - n + 1):
+        g = tuple(tokens[i:i + n])
+        grams[g] = grams.get(g, 0) + 1
+    return grams
+
+
+def _f1(overlap, candidate_total, reference_total):
+    if not overlap:
+        return 0.0
+    p, r = overlap / candidate_total, overlap / reference_total
+    return 2 * p * r / (p + r)
+
+
+def _lcs(a, b):
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        cur = [0]
+        for j, y in enumerate(b):
+            cur.append(prev[j] + 1 if x == y else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+
+def rouge(candidate: str, reference: str) -> dict:
+    c, r = _tokens(candidate), _tokens(reference)
+    scores = {}
+    for n in (1, 2):
+        cg, rg = _ngrams(c, n), _ngrams(r, n)
+        overlap = sum(min(v, rg.get(g, 0)) for g, v in cg.items())
+        scores[f'rouge{n}'] = _f1(overlap, max(1, len(c) - n + 1), max(1, len(r) - n + 1))
+    scores['rougeL'] = _f1(_lcs(c, r), max(1, len(c)), max(1, len(r)))
+    return scores
+
+
+def _pct(values, p):
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(p / 100 * len(s)) - 1))]  # nearest rank
+
+
+# -- running ---------------------------------------------------------------
+
+def cache_key(model_id: str, data_id: str, config: dict) -> str:
+    raw = json.dumps({'model': model_id, 'data': data_id, 'generate': config['generate']}, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def evaluate_config(tokenizer, model, examples, config: dict) -> dict:
+    torch.manual_seed(0)  # sampling configs are reproducible run to run
+    random.seed(0)
+    latencies, rows = [], []
+    for ex in examples:
+        inputs = tokenizer(ex['input'], return_tensors='pt', truncation=True, max_length=512)
+        started = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(**inputs, **config['generate'])
+        latencies.append(time.perf_counter() - started)
+        text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        rows.append({'output': text, 'new_tokens': int(outputs.shape[-1]) - 1, **rouge(text, ex['output'])})
+    words = [len(_tokens(r['output'])) for r in rows]
+    ref_words = [max(1, len(_tokens(ex['output']))) for ex in examples]
+    n = len(rows)
+    return {
+        'name': config['name'],
+        'generate': config['generate'],
+        'examples': n,
+        'rouge1': round(sum(r['rouge1'] for r in rows) / n, 4),
+        'rouge2': round(sum(r['rouge2'] for r in rows) / n, 4),
+        'rougeL': round(sum(r['rougeL'] for r in rows) / n, 4),
+        'words_mean': round(statistics.mean(words), 1),
+        'words_p95': _pct(words, 95),
+        'length_ratio': round(statistics.mean(w / rw for w, rw in zip(words, ref_words)), 3),
+        'empty': sum(1 for w in words if w == 0),
+        'latency_ms_mean': round(statistics.mean(latencies) * 1000, 1),
+        'latency_ms_p50': round(_pct(latencies, 50) * 1000, 1),
+        'latency_ms_p95': round(_pct(latencies, 95) * 1000, 1),
+        'tokens_per_sec': round(sum(r['new_tokens'] for r in rows) / sum(latencies), 1),
+        'outputs': [r['output'] for r in rows],
+    }
+
+
+def pareto_frontier(results: list) -> set:
+    """Names of configs no other config beats on both p50 latency (lower) and ROUGE-L (higher)."""
+    frontier = set()
+    for a in results:
+        dominated = any(
+            b['latency_ms_p50'] <= a['latency_ms_p50'] and b['rougeL'] >= a['rougeL']
+            and (b['latency_ms_p50'] < a['latency_ms_p50'] or b['rougeL'] > a['rougeL'])
+            for b in results
+        )
+        if not dominated:
+            frontier.add(a['name'])
+    return frontier
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decoding configuration sweep (quality vs latency)')
+    parser.add_argument('--csv_path', type=str, default=os.getenv('DATA_PATH', 'healthcare_chatbot_dataset_large.csv'), help='Path to dataset CSV')
+    parser.add_argument('--max_samples', type=int, default=int(os.getenv('MAX_SAMPLES', '50000')),
+                        help='Same value as used for training, so the test split matches')
+    parser.add_argument('--eval_samples', type=int, default=200, help='Test examples per config')
+    parser.add_argument('--model_path', type=str, default=MODEL_PATH if os.path.isdir(MODEL_PATH) else BASE_MODEL,
+                        help='Model folder or hub name')
+    parser.add_argument('--configs', type=str, help='JSON file with [{"name": ..., "generate": {...}}] (default: built-in grid)')
+    parser.add_argument('--threads', type=int, default=0, help='torch CPU threads (0: torch default)')
+    parser.add_argument('--cache_dir', type=str, default='eval_cache/decoding', help='Per-config result cache')
+    parser.add_argument('--output', type=str, default='decoding_sweep.json', help='Report file')
+    parser.add_argument('--min_rouge_l', type=float, help='Quality bar: report the fastest config at or above it')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_path):
+        logger.error(f"Dataset not found at {args.csv_path}")
+        raise FileNotFoundError(args.csv_path)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    configs = default_grid()
+    if args.configs:
+        with open(args.configs, encoding='utf-8') as fh:
+            configs = json.load(fh)
+
+    st = os.stat(args.csv_path)
+    data_id = f"{os.path.abspath(args.csv_path)}:{st.st_size}:{st.st_mtime_ns}:{args.max_samples}:{args.eval_samples}"
+    model_id = model_fingerprint(args.model_path)
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    results, todo = [], []
+    for config in configs:
+        path = os.path.join(args.cache_dir, cache_key(model_id, data_id, config) + '.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as fh:
+                results.append(dict(json.load(fh), name=config['name']))
+        else:
+            todo.append((config, path))
+    logger.info(f"{len(configs)} configs: {len(results)} cached, {len(todo)} to run")
+
+    if todo:
+        # the training pipeline (nltk, datasets) is only needed when something has to run
+        from train import HealthcareChatDataset
+        _, _, test = HealthcareChatDataset(args.csv_path).prepare_for_training(max_samples=args.max_samples)
+        examples = test[:args.eval_samples]
+        local = os.path.isdir(args.model_path)
+        tokenizer = AutoTokenizer.from_pretrained(args.model_path, local_files_only=local)
+        model = AutoModelForSeq2SeqLM.from_pretrained(args.model_path, local_files_only=local)
+        model.to('cpu')
+        model.eval()
+        for i, (config, path) in enumerate(todo, 1):
+            logger.info(f"[{i}/{len(todo)}] {config['name']}")
+            result = evaluate_config(tokenizer, model, examples, config)
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump(result, fh)
+            os.replace(tmp, path)
+            results.append(result)
+
+    frontier = pareto_frontier(results)
+    results.sort(key=lambda r: r['latency_ms_p50'])
+    print(f"{'':2}{'config':<32}{'p50 ms':>9}{'p95 ms':>9}{'tok/s':>8}{'R-1':>7}{'R-2':>7}{'R-L':>7}{'words':>7}{'len':>6}")
+    for r in results:
+        print(f"{'*' if r['name'] in frontier else ' ':2}{r['name']:<32}{r['latency_ms_p50']:>9.1f}{r['latency_ms_p95']:>9.1f}"
+              f"{r['tokens_per_sec']:>8.1f}{r['rouge1']:>7.3f}{r['rouge2']:>7.3f}{r['rougeL']:>7.3f}"
+              f"{r['words_mean']:>7.1f}{r['length_ratio']:>6.2f}")
+    print("* = Pareto frontier (no config is both faster and better on ROUGE-L)")
+
+    choice = None
+    if args.min_rouge_l is not None:
+        passing = [r for r in results if r['rougeL'] >= args.min_rouge_l]
+        choice = passing[0]['name'] if passing else None
+        print(f"Fastest config with ROUGE-L >= {args.min_rouge_l}: {choice or 'none'}")
+
+    report = {
+        'model': model_id,
+        'data': {'csv_path': args.csv_path, 'max_samples': args.max_samples, 'eval_samples': args.eval_samples},
+        'threads': torch.get_num_threads(),
+        'frontier': [r['name'] for r in results if r['name'] in frontier],
+        'min_rouge_l': args.min_rouge_l,
+        'choice': choice,
+        'results': [{k: v for k, v in r.items() if k != 'outputs'} for r in results],
+    }
+    with open(args.output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""HTTP load test: a realistic traffic mix against the app, RPS and latency percentiles per route.
+
+    python loadtest/run.py --duration 30 --patients 20 --doctors 3 [--json results.json] [--baseline old.json]
+
+Boots app.py in-process against in-memory Mongo and a stand-in model (see
+stubs.py), or drives --target http://host:port. Each virtual user is a thread
+with its own account and keep-alive connection, picking operations by --mix
+weights with no think time:
+
+    patients: login, ask, assess, history (own), appointments (request one
+              after a serious assessment)
+    doctors:  login, ask, history (a patient's), appointments (list)
+
+Requests in the first --warmup seconds are not counted. With --baseline, p95
+latency or RPS worse than the baseline by more than --max_regression fails the
+run (exit code 1), so it can gate changes in CI.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS = [
+    "What are the side effects of omeprazole?",
+    "What is the dosage of cetirizine?",
+    "I have had a headache and mild fever since yesterday, what should I do?",
+    "How can I manage seasonal allergies at home?",
+    "My throat hurts when I swallow and I feel tired. Is it serious?",
+    "What foods help with acid reflux?",
+    "How much water should I drink when I have a cold?",
+    "Can stress cause stomach pain?",
+]
+FORMS = [
+    {'age': 34, 'symptoms': 'runny nose, sneezing', 'duration': '2', 'allergies': '', 'conditions': ''},
+    {'age': 52, 'symptoms': 'cough and mild fever', 'duration': '4', 'allergies': 'penicillin', 'conditions': 'asthma'},
+    {'age': 61, 'symptoms': 'chest pain and shortness of breath', 'duration': '1', 'allergies': '', 'conditions': 'hypertension'},
+    {'age': 3, 'symptoms': 'high fever', 'duration': '2', 'allergies': '', 'conditions': ''},
+]
+DEFAULT_MIX = 'ask=35,history=30,assess=10,appointments=15,login=10'
+PASSWORD = 'loadtest-password'
+
+
+def _pct(values, p):
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(p / 100 * len(s)) - 1))]  # nearest rank
+
+
+class Client:
+    """One keep-alive connection; request() returns (status, parsed body or None, seconds)."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.conn = None
+        self.token = None
+
+    def request(self, method: str, path: str, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            self.conn.request(method, path, payload, headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            return 'error', None, time.perf_counter() - started
+        elapsed = time.perf_counter() - started
+        try:
+            return status, json.loads(data) if data else None, elapsed
+        except ValueError:
+            return status, None, elapsed
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, client: Client, role: str, email: str, user_id: str, mix: dict, stop_at: float,
+                 count_from: float, patient_ids: list, seed: int):
+        super().__init__(daemon=True)
+        self.client, self.role, self.email, self.user_id = client, role, email, user_id
+        self.ops, self.weights = zip(*mix.items())
+        self.stop_at, self.count_from = stop_at, count_from
+        self.patient_ids = patient_ids
+        self.rnd = random.Random(seed)
+        self.latencies = {}  # route -> [seconds]
+        self.statuses = {}  # route -> Counter
+        self.serious_assessment = None
+
+    def _call(self, route: str, method: str, path: str, body=None):
+        status, data, elapsed = self.client.request(method, path, body)
+        if time.perf_counter() >= self.count_from:
+            self.latencies.setdefault(route, []).append(elapsed)
+            self.statuses.setdefault(route, Counter())[str(status)] += 1
+        return status, data
+
+    def run(self):
+        while time.perf_counter() < self.stop_at:
+            op = self.rnd.choices(self.ops, self.weights)[0]
+            getattr(self, f"op_{op}")()
+
+    def op_login(self):
+        status, data = self._call('POST /api/auth/login', 'POST', '/api/auth/login',
+                                  {'email': self.email, 'password': PASSWORD})
+        if status == 200:
+            self.client.token = data['token']
+
+    def op_ask(self):
+        self._call('POST /api/chat/ask', 'POST', '/api/chat/ask', {'question': self.rnd.choice(QUESTIONS)})
+
+    def op_assess(self):
+        if self.role == 'doctor':
+            return self.op_ask()
+        status, data = self._call('POST /api/chat/assess', 'POST', '/api/chat/assess', self.rnd.choice(FORMS))
+        if status == 200 and data.get('severity') in ('critical', 'urgent'):
+            self.serious_assessment = data['assessment_id']
+
+    def op_history(self):
+        if self.role == 'doctor':
+            pid = self.rnd.choice(self.patient_ids)
+            self._call('GET /api/chat/patient/<id>/history', 'GET', f'/api/chat/patient/{pid}/history')
+        else:
+            self._call('GET /api/chat/history', 'GET', '/api/chat/history')
+
+    def op_appointments(self):
+        if self.role == 'doctor':
+            self._call('GET /api/chat/appointments', 'GET', '/api/chat/appointments')
+        elif self.serious_assessment:
+            self._call('POST /api/chat/appointments', 'POST', '/api/chat/appointments',
+                       {'assessment_id': self.serious_assessment, 'notes': 'load test'})
+            self.serious_assessment = None
+        else:
+            self.op_history()
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(','):
+        op, _, weight = part.partition('=')
+        if op.strip() not in ('login', 'ask', 'assess', 'history', 'appointments'):
+            raise SystemExit(f"Unknown operation in --mix: {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def summarize(vus, measured: float) -> dict:
+    latencies, statuses = {}, {}
+    for vu in vus:
+        for route, values in vu.latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, counts in vu.statuses.items():
+            statuses.setdefault(route, Counter()).update(counts)
+    routes = {}
+    everything = []
+    for route in sorted(latencies):
+        values = latencies[route]
+        everything.extend(values)
+        routes[route] = {
+            'requests': len(values),
+            'rps': round(len(values) / measured, 2),
+            'p50_ms': round(_pct(values, 50) * 1000, 1),
+            'p90_ms': round(_pct(values, 90) * 1000, 1),
+            'p95_ms': round(_pct(values, 95) * 1000, 1),
+            'p99_ms': round(_pct(values, 99) * 1000, 1),
+            'max_ms': round(max(values) * 1000, 1),
+            'statuses': dict(statuses[route]),
+        }
+    total = {
+        'requests': len(everything),
+        'rps': round(len(everything) / measured, 2),
+        'p50_ms': round(_pct(everything, 50) * 1000, 1) if everything else None,
+        'p95_ms': round(_pct(everything, 95) * 1000, 1) if everything else None,
+        'p99_ms': round(_pct(everything, 99) * 1000, 1) if everything else None,
+    }
+    return {'routes': routes, 'total': total}
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Human-readable regressions of report against baseline (same routes only)."""
+    problems = []
+    for route, now in report['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            problems.append(f"{route}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if before['rps'] and now['rps'] < before['rps'] * (1 - threshold):
+            problems.append(f"{route}: {before['rps']} -> {now['rps']} requests/s")
+    return problems
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the HTTP API with a realistic traffic mix')
+    parser.add_argument('--target', type=str, help='Base URL of a running server (default: boot one in-process)')
+    parser.add_argument('--model', type=str, default='stub', choices=('stub', 'tiny'), help='Model stand-in (in-process server)')
+    parser.add_argument('--ms_per_token', type=float, default=2.0, help='Stub model: cost per generated token')
+    parser.add_argument('--patients', type=int, default=20, help='Patient virtual users')
+    parser.add_argument('--doctors', type=int, default=3, help='Doctor virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load, warmup included')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds before requests are counted')
+    parser.add_argument('--mix', type=str, default=DEFAULT_MIX, help='Operation weights, e.g. ask=35,history=30')
+    parser.add_argument('--no_rate_limit', action='store_true',
+                        help='In-process server: lift the per-user admission rate limit to measure raw throughput')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, help='Write the report to this file')
+    parser.add_argument('--baseline', type=str, help='Earlier --json report to compare against')
+    parser.add_argument('--max_regression', type=float, default=0.25, help='Allowed relative p95/RPS regression')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.target:
+        url = urlparse(args.target)
+        host, port = url.hostname, url.port or 80
+    else:
+        from loadtest.server import start
+        server = start(model=args.model, ms_per_token=args.ms_per_token)
+        host, port = '127.0.0.1', server.port
+        if args.no_rate_limit:
+            from utils.admission import model_admission
+            model_admission.rate = model_admission.burst = 1e9
+
+    run_id = f"{int(time.time())}{os.getpid()}"
+    accounts = []
+    for role, count in (('patient', args.patients), ('doctor', args.doctors)):
+        for i in range(count):
+            client = Client(host, port)
+            email = f"lt-{run_id}-{role}{i}@gmail.com"
+            status, data, _ = client.request('POST', '/api/auth/signup', {
+                'name': f"Load {role} {i}", 'email': email, 'password': PASSWORD, 'role': role})
+            if status != 200:
+                raise SystemExit(f"Signup failed ({status}): {data}")
+            client.token = data['token']
+            accounts.append((client, role, email, data['user_id']))
+    patient_ids = [a[3] for a in accounts if a[1] == 'patient'] or [accounts[0][3]]
+    print(f"{len(accounts)} virtual users against http://{host}:{port} for {args.duration:.0f}s "
+          f"({args.warmup:.0f}s warmup), mix {args.mix}")
+
+    started = time.perf_counter()
+    count_from, stop_at = started + args.warmup, started + args.duration
+    vus = [VirtualUser(client, role, email, uid, mix, stop_at, count_from, patient_ids, args.seed + i)
+           for i, (client, role, email, uid) in enumerate(accounts)]
+    for vu in vus:
+        vu.start()
+    for vu in vus:
+        vu.join()
+    measured = max(1e-9, time.perf_counter() - count_from)
+
+    report = summarize(vus, measured)
+    report.update({
+        'measured_seconds': round(measured, 1),
+        'target': args.target or f"in-process ({args.model} model, mongomock)",
+        'patients': args.patients, 'doctors': args.doctors, 'mix': mix,
+        'revision': _git_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+
+    print(f"{'route':<38}{'reqs':>7}{'rps':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  statuses")
+    for route, r in report['routes'].items():
+        print(f"{route:<38}{r['requests']:>7}{r['rps']:>8.1f}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}  {r['statuses']}")
+    t = report['total']
+    print(f"{'total':<38}{t['requests']:>7}{t['rps']:>8.1f}  (latencies in ms)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if any(baseline.get(k) != report[k] for k in ('mix', 'patients', 'doctors')):
+            print("Note: the baseline used a different mix or user count; the comparison is only indicative")
+        problems = compare(report, baseline, args.max_regression)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"No regression beyond {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Serve app.py with the load-test stand-ins installed (see stubs.py).
+
+    python loadtest/server.py --port 5001 [--model stub|tiny]
+
+run.py boots the same server in-process unless it is given --target; start
+this one separately to load test from another machine or process.
+"""
+import os
+import sys
+import argparse
+import logging
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from loadtest import stubs
+
+
+def start(host: str = '127.0.0.1', port: int = 0, **stub_options):
+    """Install the stand-ins, import the app and serve it from a daemon thread; returns the server."""
+    stubs.install(**stub_options)
+    from app import app
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the app against in-memory Mongo and a stand-in model')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--model', type=str, default='stub', choices=('stub', 'tiny'), help='Model stand-in')
+    parser.add_argument('--ms_per_token', type=float, default=2.0, help='Stub model: cost per generated token')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = start(args.host, args.port, model=args.model, ms_per_token=args.ms_per_token)
+    print(f"Serving on http://{args.host}:{server.port} ({args.model} model, in-memory Mongo); Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
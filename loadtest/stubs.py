@@ -0,0 +1,95 @@
+"""Stand-ins for mongod and the seq2seq model, so the app can be load tested anywhere.
+
+install() must run before `app` is imported: it points db.mongo at an
+in-memory mongomock client (through set_client) and swaps the model_loader
+tokenizer/model for either
+
+- `stub`: sleeps ms_per_token for each token it pretends to generate and
+  returns a fixed answer, so the app's own overhead (auth, Mongo, admission,
+  scheduling, serialization) is what gets measured; or
+- `tiny`: a randomly initialised 2-layer T5 with the real tokenizer, which
+  exercises real tokenization and generate() at a fraction of FLAN-T5's cost.
+
+Everything above model.generate (prompting, scheduler slots, single-flight,
+post-processing) runs unchanged.
+"""
+import os
+import time
+import tempfile
+import logging
+
+log = logging.getLogger(__name__)
+
+STUB_ANSWER = (
+    "Rest, drink plenty of fluids and monitor your temperature. Paracetamol or ibuprofen can help with "
+    "fever and aches if you have no contraindication. See a doctor if symptoms persist beyond three days "
+    "or get worse."
+)
+
+
+class _Encoded(dict):
+    def to(self, device):
+        return self
+
+
+class StubTokenizer:
+    pad_token_id = 0
+
+    def __call__(self, text, **kwargs):
+        return _Encoded(texts=[text] if isinstance(text, str) else list(text))
+
+    def decode(self, output, **kwargs):
+        return output
+
+    def batch_decode(self, outputs, **kwargs):
+        return list(outputs)
+
+
+class StubModel:
+    """generate() costs ms_per_token per output token (capped by max_length / max_new_tokens)."""
+
+    def __init__(self, ms_per_token: float, tokens: int):
+        self.ms_per_token = ms_per_token
+        self.tokens = tokens
+
+    def generate(self, texts, max_length=None, max_new_tokens=None, num_beams=1, **kwargs):
+        n = min(self.tokens, max_new_tokens or max_length or self.tokens)
+        # beams are batched on real hardware, so they cost far less than linearly
+        time.sleep(self.ms_per_token / 1000 * n * (1 + 0.1 * (num_beams - 1)))
+        return [STUB_ANSWER] * len(texts)
+
+
+def tiny_model(tokenizer_name: str):
+    """(tokenizer, random 2-layer T5) sharing the real tokenizer's vocabulary."""
+    import torch
+    from transformers import AutoTokenizer, T5Config, T5ForConditionalGeneration
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=os.path.isdir(tokenizer_name))
+    config = T5Config(vocab_size=len(tokenizer), d_model=64, d_ff=256, d_kv=16, num_heads=4, num_layers=2,
+                      num_decoder_layers=2, pad_token_id=tokenizer.pad_token_id,
+                      eos_token_id=tokenizer.eos_token_id, decoder_start_token_id=tokenizer.pad_token_id)
+    torch.manual_seed(0)
+    return tokenizer, T5ForConditionalGeneration(config).eval()
+
+
+def install(model: str = 'stub', ms_per_token: float = 2.0, tokens: int = 120, tokenizer_name: str = None):
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("The load tests need mongomock: pip install mongomock")
+    from db.mongo import set_client
+    from db.write_behind import chat_writer
+    from utils import model_loader
+
+    set_client(mongomock.MongoClient())
+    # keep the spool of this throwaway database out of the real one
+    chat_writer.spool_dir = tempfile.mkdtemp(prefix='loadtest-spool-')
+
+    if model == 'stub':
+        model_loader._tokenizer, model_loader._model = StubTokenizer(), StubModel(ms_per_token, tokens)
+    elif model == 'tiny':
+        from config import MODEL_PATH, BASE_MODEL
+        name = tokenizer_name or (MODEL_PATH if os.path.isdir(MODEL_PATH) else BASE_MODEL)
+        model_loader._tokenizer, model_loader._model = tiny_model(name)
+    else:
+        raise ValueError(f"Unknown model stand-in: {model}")
+    log.info(f"Load-test stand-ins installed: mongomock, {model} model")
@@ -0,0 +1,57 @@
+"""Migrate chats from the one-document-per-turn layout into chat_buckets.
+
+    python migrate_chat_buckets.py [--batch_size 1000] [--drop_source]
+
+Safe to re-run: turns already present in a bucket are skipped. Stop the app
+first so no new turns land in `chats` mid-migration, then set
+CHAT_STORAGE_MODE = "bucket" in config.py once it has finished.
+"""
+import argparse
+import logging
+from config import CHAT_BUCKET_MAX_MESSAGES
+from db.mongo import db, chats
+from db.chat_store import BucketChatStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move chats into per-user, per-day buckets')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Turns written per bulk operation')
+    parser.add_argument('--drop_source', action='store_true', help='Drop `chats` after a verified migration')
+    args = parser.parse_args()
+
+    store = BucketChatStore(db.chat_buckets, CHAT_BUCKET_MAX_MESSAGES)
+    store.ensure_indexes()
+
+    total = chats.estimated_document_count()
+    logger.info(f"Migrating ~{total} chat documents into {store.collection_name}")
+    moved = 0
+    batch = []
+    for doc in chats.find().sort('_id', 1).batch_size(args.batch_size):
+        batch.append(doc)
+        if len(batch) >= args.batch_size:
+            store.insert_many(batch)
+            moved += len(batch)
+            batch = []
+            logger.info(f"Processed {moved}/{total}")
+    if batch:
+        store.insert_many(batch)
+        moved += len(batch)
+    logger.info(f"Processed {moved} chat documents")
+
+    source = chats.count_documents({})
+    stored = next(store.collection.aggregate([{'$group': {'_id': None, 'n': {'$sum': '$count'}}}]), {}).get('n', 0)
+    logger.info(f"Source documents: {source}, turns in buckets: {stored}")
+    if args.drop_source:
+        if stored < source:
+            logger.error("Bucket turn count is below the source count; not dropping `chats`")
+            return
+        chats.drop()
+        logger.info("Dropped `chats`")
+    logger.info('Set CHAT_STORAGE_MODE = "bucket" in config.py to serve from buckets')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
 from db.mongo import users
+import re
 import bcrypt
 import jwt
-from config import SECRET_KEY
+from config import SECRET_KEY, USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE, COUNT_ESTIMATE_CAP
 from bson.objectid import ObjectId
+from utils.serialization import json_response
+
+# fields returned by the user directory
+USER_DIRECTORY_PROJECTION = {'name': 1, 'email': 1, 'role': 1}
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -29,6 +34,7 @@ def signup():
     hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
     res = users.insert_one({
         "name": name,
+        "name_lower": name.lower(),  # for indexed prefix search in /users
         "email": email,
         "password": hashed,
         "role": role
@@ -86,12 +92,76 @@ def me():
 
 @auth_bp.route('/users', methods=['GET'])
 def list_users():
-    # list all patients (doctors should call this via auth on frontend)
+    """Paginated user directory (doctors should call this via auth on frontend).
+
+    Query params: role, q (prefix of name or email), limit, after (the
+    next_after value of the previous page), count=1. Without q pages are
+    keyset-paginated on _id; with q they are ordered by the matching name (or
+    email, for users whose name does not match) and _id, so every page walks
+    the (role,) name_lower/email + _id indexes instead of sorting in memory.
+    X-Total-Count-Estimate is sent on the first page, or on any page with count=1.
+    """
     role = request.args.get('role')
-    query = {}
-    if role:
-        query['role'] = role
-    docs = list(users.find(query, {'password': 0}))
-    for d in docs:
-        d['_id'] = str(d['_id'])
-    return jsonify({'users': docs})
+    q = (request.args.get('q') or '').strip().lower()
+    try:
+        limit = min(max(int(request.args.get('limit', USERS_PAGE_SIZE)), 1), USERS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    after = request.args.get('after')
+    cursor = _parse_user_cursor(after, keyed=bool(q)) if after else None
+    if after and cursor is None:
+        return jsonify({'error': 'invalid after cursor'}), 400
+
+    base = {'role': role} if role else {}
+    if q:
+        # anchored, case-sensitive regexes on lowercased fields can walk an index
+        prefix = re.compile('^' + re.escape(q))
+        # disjoint branches: users whose name matches sort by name, the rest by email
+        branches = [('name_lower', {**base, 'name_lower': prefix}),
+                    ('email', {**base, 'email': prefix, 'name_lower': {'$not': prefix}})]
+        count_query = {**base, '$or': [{'name_lower': prefix}, {'email': prefix}]}
+    else:
+        branches = [('_id', dict(base))]
+        count_query = base
+
+    headers = {}
+    if not after or request.args.get('count') == '1':
+        estimate = users.count_documents(count_query, limit=COUNT_ESTIMATE_CAP) if count_query \
+            else users.estimated_document_count()
+        headers['X-Total-Count-Estimate'] = str(estimate)
+
+    projection = {**USER_DIRECTORY_PROJECTION, 'name_lower': 1}
+    docs = []
+    for field, query in branches:
+        if cursor:
+            key, last_id = cursor
+            if field == '_id':
+                query['_id'] = {'$gt': last_id}
+            else:
+                query['$or'] = [{field: {'$gt': key}}, {field: key, '_id': {'$gt': last_id}}]
+        sort = [('_id', 1)] if field == '_id' else [(field, 1), ('_id', 1)]
+        for d in users.find(query, projection).sort(sort).limit(limit + 1):
+            d['_sort'] = (d.get(field, '') if field != '_id' else '', d['_id'])
+            docs.append(d)
+    docs.sort(key=lambda d: d['_sort'])
+
+    next_after = None
+    if len(docs) > limit:
+        key, last_id = docs[limit - 1]['_sort']
+        next_after = f"{last_id}:{key}" if q else str(last_id)
+    page = docs[:limit]
+    for d in page:
+        del d['_sort']
+        d.pop('name_lower', None)
+    return json_response({'users': page, 'next_after': next_after}, headers=headers)
+
+
+def _parse_user_cursor(after: str, keyed: bool):
+    """(sort key, _id) from a next_after value, or None if it is malformed."""
+    if keyed:
+        last_id, sep, key = after.partition(':')
+        if not sep:
+            return None
+    else:
+        last_id, key = after, ''
+    return (key, ObjectId(last_id)) if ObjectId.is_valid(last_id) else None
@@ -1,10 +1,33 @@
-from flask import Blueprint, request, jsonify, g
-from utils.model_loader import generate_answer
-from db.mongo import chats, users, appointments
-from utils.auth import require_auth, require_role
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
+from utils.model_loader import _apply_med_warnings, generate_answer, generate_answers
+from db.mongo import users, appointments, triage_results
+from db.chat_store import chat_store
+from db.write_behind import chat_writer
+from db.archive import chat_archive
+from utils.serialization import NDJSON_MIMETYPE, dumps, json_response, stream_json_array, ndjson_response
+from utils.events import event_hub
+from utils.search import parse_query, matches, highlight
+from config import (
+    EXPORT_BATCH_SIZE, EVENTS_HEARTBEAT, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE,
+    SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE, BULK_TRIAGE_MAX_ROWS, BULK_TRIAGE_MAX_ADVICE_ROWS,
+    GENERATION_BATCH_SIZE, ASK_BATCH_MAX_ITEMS, EVENTS_TOKEN_TTL
+)
+from utils.auth import issue_events_token, require_auth, require_role
+from utils.admission import AdmissionRejected, model_admission, rejection_response
+from utils.intent_router import IntentRouter
+from utils.triage import triage_classifier, triage_severity, wants_catalog, decoding_profile
+from utils.scheduler import priority_for
+from utils.tracing import span
 from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
 from datetime import datetime
+from itertools import chain, islice
+from typing import NamedTuple, Optional
+import heapq
 import logging
+import csv
+import io
+import re
 
 log = logging.getLogger(__name__)
 chat_bp = Blueprint("chat", __name__)
@@ -245,11 +268,40 @@ def _format_medicine_recommendation(medicine_name: str) -> str:
     return output
 
 
+SEVERITY_ORDER = ('non_urgent', 'urgent', 'critical')
+
+
+# one pass over the text instead of one substring scan per red flag
+RED_FLAG_RE = re.compile('|'.join(re.escape(rf) for rf in RED_FLAGS))
+
+
 def assess_severity(age, symptoms, duration, allergies, conditions):
+    """Rule-based severity, raised (never lowered) by the triage classifier's urgency."""
+    rules = _rule_severity(age, symptoms, duration, allergies, conditions)
+    if rules == 'critical':
+        return rules
+    return _escalate(rules, triage_severity(' '.join([str(symptoms), str(conditions)])))
+
+
+def assess_severity_many(forms: list) -> list:
+    """assess_severity for many intake forms: rules per row, one batched classifier call."""
+    rules = [_rule_severity(f.get('age'), f.get('symptoms'), f.get('duration'), f.get('allergies'),
+                            f.get('conditions')) for f in forms]
+    texts = [' '.join([str(f.get('symptoms')), str(f.get('conditions'))]) for f in forms]
+    preds = triage_classifier.predict(texts)
+    return [_escalate(r, p.severity if p else None) for r, p in zip(rules, preds)]
+
+
+def _escalate(rules: str, signal):
+    if signal and SEVERITY_ORDER.index(signal) > SEVERITY_ORDER.index(rules):
+        return signal
+    return rules
+
+
+def _rule_severity(age, symptoms, duration, allergies, conditions):
     text = ' '.join([str(symptoms), str(conditions)]).lower()
-    for rf in RED_FLAGS:
-        if rf in text:
-            return 'critical'
+    if RED_FLAG_RE.search(text):
+        return 'critical'
 
     if 'fever' in text and (age and int(age) < 2 if str(age).isdigit() else False):
         return 'urgent'
@@ -264,66 +316,297 @@ def assess_severity(age, symptoms, duration, allergies, conditions):
     return 'non_urgent'
 
 
-@chat_bp.route("/ask", methods=["POST"])
-@require_auth
-def ask():
-    data = request.json
-    question = data.get("question")
-    if not question:
-        return jsonify({"error": "question required"}), 400
+# Fields returned by ?view=summary on list endpoints. Heavy fields (context, advice,
+# model_meds_raw, medicine_details, the full assessment_snapshot) are left out and
+# fetched on demand via /assessments/<id> or /appointments/<id>.
+CHAT_SUMMARY_FIELDS = (
+    'user_id', 'type', 'question', 'answer', 'from_role', 'doctor_id',
+    'timestamp', 'created_at', 'severity', 'suggested_meds', 'form'
+)
+APPOINTMENT_SUMMARY_FIELDS = (
+    'patient_id', 'assessment_id', 'assessment_snapshot.severity', 'desired_date',
+    'notes', 'status', 'note', 'created_at', 'updated_at'
+)
+_FIELD_RE = re.compile(r'^[A-Za-z_]\w*(\.\w+)*$')
+PATIENT_LOOKUP_BATCH = 200
+
+
+def _requested_projection(summary_fields, required=()):
+    """Mongo projection for ?fields=a,b.c or ?view=summary; None means full documents.
+
+    Raises ValueError on malformed field names.
+    """
+    fields = request.args.get('fields')
+    if fields:
+        names = [f.strip() for f in fields.split(',') if f.strip()]
+        bad = [f for f in names if not _FIELD_RE.match(f)]
+        if bad:
+            raise ValueError(f"invalid field name(s): {', '.join(bad)}")
+    elif request.args.get('view') == 'summary':
+        names = list(summary_fields)
+    else:
+        return None
+    names += [f for f in required if f not in names]
+    # Mongo rejects overlapping paths such as 'form' and 'form.age'
+    names = [n for n in names if not any(n.startswith(o + '.') for o in names)]
+    return {n: 1 for n in names}
+
+
+def _project(doc: dict, projection) -> dict:
+    """Apply an inclusion projection in Python (for documents that never went through Mongo)."""
+    if not projection:
+        return doc
+    out = {'_id': doc['_id']}
+    for path in projection:
+        src, dst = doc, out
+        parts = path.split('.')
+        for p in parts[:-1]:
+            if not isinstance(src.get(p), dict):
+                break
+            src = src[p]
+            dst = dst.setdefault(p, {})
+        else:
+            if parts[-1] in src:
+                dst[parts[-1]] = src[parts[-1]]
+    return out
 
-    # Use authenticated user id and role
-    user_id = g.user_id
-    role = g.role or 'patient'
 
+def _find_chat(query: dict):
+    """find_one on chats that also sees documents still in the write-behind buffer."""
+    doc = chat_store.find_one(query)
+    if doc is None:
+        pending = chat_writer.get(query['_id'])
+        if pending and all(pending.get(k) == v for k, v in query.items()):
+            doc = pending
+    return doc
+
+
+def _with_pending(docs, user_id: str, projection=None):
+    """Yield docs, then buffered (not yet flushed) chats of user_id so history reads see their own writes."""
+    seen = set()
+    for d in docs:
+        seen.add(d['_id'])
+        yield d
+    for d in chat_writer.pending_for(user_id):
+        if d['_id'] not in seen:
+            yield _project(d, projection)
+
+
+def _history_response(user_id: str):
+    try:
+        projection = _requested_projection(CHAT_SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'limit' in request.args or 'before' in request.args:
+        return _history_page(user_id, projection)
+    docs = chat_store.history(user_id, projection)
+    if chat_archive.has(user_id):
+        docs = chain((_project(d, projection) for d in chat_archive.iter_user(user_id)), docs)
+    return stream_json_array('history', _with_pending(docs, user_id, projection))
+
+
+def _history_page(user_id: str, projection):
+    """Keyset page of the newest turns before ?before=<message id>, returned oldest first.
+
+    Pages come from Mongo (plus the write-behind buffer) while the cursor is in
+    the hot window and continue into the archive segments once it pages past it.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    before = request.args.get('before') or None
+    if before is not None:
+        if not ObjectId.is_valid(before):
+            return jsonify({'error': 'invalid before cursor'}), 400
+        before = ObjectId(before)
+
+    pending = sorted((_project(d, projection) for d in chat_writer.pending_for(user_id)
+                      if before is None or d['_id'] < before), key=lambda d: d['_id'], reverse=True)
+    docs = heapq.merge(pending, chat_store.history_desc(user_id, before, projection),
+                       key=lambda d: d['_id'], reverse=True)
+    if chat_archive.has(user_id):
+        docs = chain(docs, (_project(d, projection) for d in chat_archive.iter_user_desc(user_id, before)))
+
+    page = []
+    seen = set()
+    for d in docs:
+        if d['_id'] in seen:
+            continue
+        seen.add(d['_id'])
+        page.append(d)
+        if len(page) == limit:
+            break
+    next_before = str(page[-1]['_id']) if len(page) == limit else None
+    page.reverse()
+    return json_response({'history': page, 'next_before': next_before})
+
+
+# answers plain medicine-catalog questions on /ask without a model generation
+intent_router = IntentRouter(MEDICINE_DATABASE, _format_medicine_recommendation)
+
+
+def plan_answer(question: str, role: str, context):
+    """(catalog answer, None) for a catalog lookup, else (None, generate_answer kwargs).
+
+    The triage classifier (when trained) widens the catalog fast path and picks
+    the scheduling priority and decoding profile of the generation.
+    """
+    triage = triage_classifier.predict_one(question)
+    routed = intent_router.route(question, context, catalog_hint=wants_catalog(triage))
+    if routed:
+        # catalog answers get the same medication cautions as model answers
+        return _apply_med_warnings(question, routed.answer, context), None
+    return None, {
+        'role': role,
+        'context': context,
+        'priority': priority_for(role=role, severity=triage.severity if triage else None),
+        'profile': decoding_profile(triage),
+    }
+
+
+class AskPlan(NamedTuple):
+    question: str
+    context: dict
+    answer: Optional[str]  # catalog answer, or None when the model has to answer
+    generation: Optional[dict]  # generate_answer kwargs for model answers
+
+
+def prepare_ask(item, role: str):
+    """Validate one /ask body ({question, context}) and plan its answer.
+
+    Returns (AskPlan, None), or (None, error message) for an invalid body.
+    Shared by /ask, /ask/batch and the native /ask in asgi.py.
+    """
+    question = item.get('question') if isinstance(item, dict) else None
+    if not question or not isinstance(question, str):
+        return None, 'question required'
     # Optional context fields (e.g., current medications, symptoms)
-    context = data.get('context', {})
+    context = item.get('context') or {}
+    if not isinstance(context, dict):
+        return None, 'context must be an object'
+    answer, generation = plan_answer(question, role, context)
+    return AskPlan(question, context, answer, generation), None
 
-    answer = generate_answer(question, role=role, context=context)
 
-    res = chats.insert_one({
+def ask_document(user_id: str, plan: AskPlan, answer: str, timestamp=None) -> dict:
+    """The chat turn stored for an answered /ask question."""
+    return {
         "user_id": user_id,
-        "question": question,
+        "question": plan.question,
         "answer": answer,
         "from_role": "system",
-        "context": context,
-        "timestamp": datetime.utcnow()
-    })
+        "context": plan.context,
+        "source": 'model' if plan.generation else 'catalog',
+        "timestamp": timestamp or datetime.utcnow()
+    }
 
-    inserted_id = str(res.inserted_id)
-    return jsonify({"answer": answer, "message_id": inserted_id})
 
+@chat_bp.route("/ask", methods=["POST"])
+@require_auth
+def ask():
+    plan, error = prepare_ask(request.get_json(silent=True), g.role or 'patient')
+    if error:
+        return jsonify({"error": error}), 400
 
-@chat_bp.route('/history', methods=['GET'])
+    answer = plan.answer
+    if plan.generation:
+        # only model generations count against admission control
+        try:
+            with model_admission.ticket(g.user_id, plan.generation['priority']):
+                answer = generate_answer(plan.question, **plan.generation)
+        except AdmissionRejected as e:
+            return rejection_response(e)
+
+    doc = ask_document(g.user_id, plan, answer)
+    inserted_id = chat_writer.insert(doc)
+    return jsonify({"answer": answer, "message_id": str(inserted_id), "source": doc['source']})
+
+
+@chat_bp.route('/ask/batch', methods=['POST'])
 @require_auth
-def history():
+def ask_batch():
+    """Several /ask questions in one request: {"items": [{question, context}, ...]} or a bare list.
+
+    Catalog lookups are answered directly. The rest are admitted one ticket per
+    item at routine priority; items past the first rejection get an error with
+    retry_after. Admitted items are generated in padded batches, grouped by
+    priority and decoding profile. All turns are stored with one bulk insert. Each result carries its
+    index and either answer, message_id and source, or an error.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    if len(items) > ASK_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'at most {ASK_BATCH_MAX_ITEMS} items per batch'}), 413
+
     user_id = g.user_id
-    docs = list(chats.find({'user_id': user_id}).sort('timestamp', 1))
-    for d in docs:
-        d['_id'] = str(d['_id'])
-        if 'timestamp' in d and hasattr(d['timestamp'], 'isoformat'):
-            d['timestamp'] = d['timestamp'].isoformat()
-    return jsonify({'history': docs})
+    role = g.role or 'patient'
+    now = datetime.utcnow()
+    results = [None] * len(items)
+    docs = [None] * len(items)
+    groups = {}  # (priority, profile) -> indexes waiting for the model
+    for i, item in enumerate(items):
+        plan, error = prepare_ask(item, role)
+        if error:
+            results[i] = {'index': i, 'error': error}
+            continue
+        docs[i] = ask_document(user_id, plan, plan.answer, now)
+        if plan.generation:
+            groups.setdefault((plan.generation['priority'], plan.generation['profile']), []).append(i)
+
+    if groups:
+        admitted = {}
+        rejected = None
+        for key, idxs in groups.items():
+            for i in idxs:
+                if rejected is None:
+                    try:
+                        model_admission.try_admit(user_id, 'routine')
+                        admitted.setdefault(key, []).append(i)
+                        continue
+                    except AdmissionRejected as e:
+                        rejected = e
+                docs[i] = None
+                results[i] = {'index': i, 'error': rejected.message, 'retry_after': rejected.retry_after}
+        if not admitted and not any(d and d['source'] == 'catalog' for d in docs):
+            return rejection_response(rejected)
+        try:
+            for (priority, profile), idxs in admitted.items():
+                try:
+                    answers = generate_answers([docs[i]['question'] for i in idxs], role=role,
+                                               contexts=[docs[i]['context'] for i in idxs],
+                                               priority=priority, profile=profile)
+                except Exception as e:
+                    log.exception(f"Batch generation of {len(idxs)} answers failed: {e}")
+                    for i in idxs:
+                        docs[i] = None
+                        results[i] = {'index': i, 'error': 'generation failed'}
+                    continue
+                for i, answer in zip(idxs, answers):
+                    docs[i]['answer'] = answer
+        finally:
+            # batched wall time is not a per-request service time, so no EWMA sample
+            for idxs in admitted.values():
+                for _ in idxs:
+                    model_admission.release(user_id)
+
+    stored = [(i, d) for i, d in enumerate(docs) if d]
+    chat_writer.insert_many([d for _, d in stored])
+    for i, d in stored:
+        results[i] = {'index': i, 'answer': d['answer'], 'message_id': str(d['_id']), 'source': d['source']}
+    return jsonify({'results': results})
 
 
-# Assessment endpoint: accepts patient condition form, returns advice + severity
-@chat_bp.route('/assess', methods=['POST'])
+@chat_bp.route('/history', methods=['GET'])
 @require_auth
-def assess():
-    data = request.json or {}
-    age = data.get('age')
-    symptoms = data.get('symptoms') or ''
-    duration = data.get('duration') or ''
-    allergies = data.get('allergies') or ''
-    conditions = data.get('conditions') or ''
-
-    if not symptoms:
-        return jsonify({'error': 'symptoms required'}), 400
+def history():
+    return _history_response(g.user_id)
 
-    # assess without relying on meds field
-    severity = assess_severity(age, symptoms, duration, allergies, conditions)
 
-    prompt = (
+def _advice_prompt(age, symptoms, duration, allergies, conditions, severity) -> str:
+    return (
         f"You are an experienced medical information specialist. A patient reports the following:\n\n"
         f"Age: {age}\n"
         f"Symptoms: {symptoms}\n"
@@ -340,12 +623,36 @@ def assess():
         f"Be thorough, practical, and safety-conscious. Highlight any red flags."
     )
 
-    advice = generate_answer(prompt, role='patient', context={
+
+def _advice_context(age, symptoms, allergies, conditions) -> dict:
+    return {
         'symptoms': symptoms,
         'conditions': conditions,
         'allergies': allergies,
         'age': age
-    })
+    }
+
+
+# Assessment endpoint: accepts patient condition form, returns advice + severity
+@chat_bp.route('/assess', methods=['POST'])
+@require_auth
+def assess():
+    data = request.json or {}
+    age = data.get('age')
+    symptoms = data.get('symptoms') or ''
+    duration = data.get('duration') or ''
+    allergies = data.get('allergies') or ''
+    conditions = data.get('conditions') or ''
+
+    if not symptoms:
+        return jsonify({'error': 'symptoms required'}), 400
+
+    # assess without relying on meds field; rule-based and cheap, so it runs before admission
+    # and a critical assessment can use the capacity reserved for it
+    severity = assess_severity(age, symptoms, duration, allergies, conditions)
+
+    prompt = _advice_prompt(age, symptoms, duration, allergies, conditions, severity)
+    priority = priority_for(severity=severity)
 
     # Ask the trained model to list medicine suggestions (short list)
     meds_prompt = (
@@ -355,19 +662,26 @@ def assess():
         "If no medications are appropriate, respond with: 'None recommended at this time.' "
         "Example format: 'acetaminophen, ibuprofen (if no contraindication)'"
     )
-    meds_raw = generate_answer(meds_prompt, role='patient', context={
-        'symptoms': symptoms,
-        'conditions': conditions,
-        'allergies': allergies
-    })
-    validated_meds = _extract_valid_meds(meds_raw)
-
-    # Generate detailed medicine information
-    medicine_details = {}
-    for med in validated_meds:
-        med_info = _get_medicine_info(med)
-        if med_info:
-            medicine_details[med] = med_info
+    try:
+        with model_admission.ticket(g.user_id, priority):
+            advice = generate_answer(prompt, role='patient',
+                                     context=_advice_context(age, symptoms, allergies, conditions), priority=priority)
+            meds_raw = generate_answer(meds_prompt, role='patient', context={
+                'symptoms': symptoms,
+                'conditions': conditions,
+                'allergies': allergies
+            }, priority=priority)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    with span('extract_meds'):
+        validated_meds = _extract_valid_meds(meds_raw)
+
+        # Generate detailed medicine information
+        medicine_details = {}
+        for med in validated_meds:
+            med_info = _get_medicine_info(med)
+            if med_info:
+                medicine_details[med] = med_info
 
     assessment_doc = {
         'user_id': g.user_id,
@@ -387,8 +701,7 @@ def assess():
         'created_at': datetime.utcnow()
     }
 
-    res = chats.insert_one(assessment_doc)
-    assessment_id = str(res.inserted_id)
+    assessment_id = str(chat_writer.insert(assessment_doc))
 
     return jsonify({
         'assessment_id': assessment_id,
@@ -400,6 +713,141 @@ def assess():
     })
 
 
+BULK_TRIAGE_FIELDS = ('age', 'symptoms', 'duration', 'allergies', 'conditions')
+
+
+def _bulk_triage_rows() -> list:
+    """Rows of a bulk triage upload: a JSON array (or {"rows": [...]}) or CSV (file field or body).
+
+    Raises ValueError when the upload can't be read.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError('expected a JSON array of objects or {"rows": [...]}')
+        return rows
+    upload = request.files.get('file')
+    raw = upload.read() if upload else request.get_data()
+    if not raw:
+        raise ValueError('send a CSV file (multipart field "file"), a CSV body or a JSON array')
+    try:
+        text = raw.decode('utf-8-sig')  # spreadsheet exports often start with a BOM
+    except UnicodeDecodeError:
+        raise ValueError('CSV must be UTF-8 encoded')
+    reader = csv.DictReader(io.StringIO(text))
+    # spreadsheet headers such as "Symptoms" or "Patient ID"
+    return [{k.strip().lower().replace(' ', '_'): (v or '').strip() for k, v in row.items() if k}
+            for row in reader]
+
+
+def _triage_line(doc: dict) -> dict:
+    line = {'row': doc['row'], '_id': doc['_id'], 'ref': doc['ref'], 'patient_id': doc['patient_id'],
+            'severity': doc['severity']}
+    if 'error' in doc:
+        line['error'] = doc['error']
+    return line
+
+
+@chat_bp.route('/triage/bulk', methods=['POST'])
+@require_auth
+@require_role('doctor')
+def bulk_triage():
+    """Severity buckets for many intake forms at once (CSV upload or JSON array).
+
+    Columns: age, symptoms, duration, allergies, conditions, plus optional
+    patient_id and ref (both echoed back). Severities use the /assess rules,
+    applied to every row in one pass, and are streamed back first as NDJSON.
+    With ?advice=1 advice is then generated in batches, most severe rows first,
+    and streamed as each batch completes. Results go to `triage_results` in one
+    insert_many; the last line is a summary carrying the batch_id.
+    """
+    try:
+        rows = _bulk_triage_rows()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not rows:
+        return jsonify({'error': 'no rows to triage'}), 400
+    if len(rows) > BULK_TRIAGE_MAX_ROWS:
+        return jsonify({'error': f'at most {BULK_TRIAGE_MAX_ROWS} rows per upload'}), 413
+    with_advice = _flag('advice')
+    if with_advice and len(rows) > BULK_TRIAGE_MAX_ADVICE_ROWS:
+        return jsonify({'error': f'advice is limited to {BULK_TRIAGE_MAX_ADVICE_ROWS} rows per upload'}), 413
+
+    forms = [{f: r.get(f) or '' for f in BULK_TRIAGE_FIELDS} for r in rows]
+    severities = assess_severity_many(forms)
+    batch_id = ObjectId()
+    now = datetime.utcnow()
+    docs = []
+    for i, (row, form, severity) in enumerate(zip(rows, forms, severities)):
+        doc = {
+            '_id': ObjectId(), 'batch_id': batch_id, 'row': i,
+            'ref': row.get('ref'), 'patient_id': row.get('patient_id') or None, 'doctor_id': g.user_id,
+            'form': form, 'severity': severity if form['symptoms'] else None, 'created_at': now,
+        }
+        if not form['symptoms']:
+            doc['error'] = 'symptoms required'
+        docs.append(doc)
+
+    user_id = g.user_id
+    if with_advice:
+        # the whole upload takes one admission ticket; generation itself is batched
+        try:
+            model_admission.try_admit(user_id)
+        except AdmissionRejected as e:
+            return rejection_response(e)
+
+    stored = False
+
+    def store():
+        nonlocal stored
+        triage_results.insert_many(docs, ordered=False)
+        stored = True
+
+    def close():
+        # runs when the response is closed, even if the client left before the stream started
+        if with_advice:
+            model_admission.release(user_id)
+        if not stored:
+            # client went away or generation failed: keep what was computed
+            try:
+                store()
+            except PyMongoError as e:
+                log.warning(f"Could not store triage batch {batch_id}: {e}")
+
+    def stream():
+        yield b''.join(dumps(_triage_line(d)) + b'\n' for d in docs)
+        if with_advice:
+            todo = sorted((d for d in docs if d['severity']),
+                          key=lambda d: -SEVERITY_ORDER.index(d['severity']))
+            for i in range(0, len(todo), GENERATION_BATCH_SIZE):
+                chunk = todo[i:i + GENERATION_BATCH_SIZE]
+                advice = generate_answers(
+                    [_advice_prompt(severity=d['severity'], **d['form']) for d in chunk],
+                    role='patient',
+                    contexts=[_advice_context(d['form']['age'], d['form']['symptoms'], d['form']['allergies'],
+                                              d['form']['conditions']) for d in chunk],
+                    # offline bulk work must not outrank interactive /assess and /ask
+                    priority='routine',
+                    batch_size=GENERATION_BATCH_SIZE,
+                )
+                for d, a in zip(chunk, advice):
+                    d['advice'] = a
+                yield b''.join(dumps({'row': d['row'], '_id': d['_id'], 'advice': d['advice']}) + b'\n'
+                               for d in chunk)
+        store()
+        counts = {s: 0 for s in SEVERITY_ORDER}
+        counts['invalid'] = 0
+        for d in docs:
+            counts[d['severity'] or 'invalid'] += 1
+        yield dumps({'summary': {'batch_id': batch_id, 'rows': len(docs), 'severity_counts': counts,
+                                 'advice': with_advice, 'stored': len(docs)}}) + b'\n'
+
+    response = Response(stream_with_context(stream()), mimetype=NDJSON_MIMETYPE)
+    response.call_on_close(close)
+    return response
+
+
 # Patient creates appointment request only for serious assessments
 @chat_bp.route('/appointments', methods=['POST'])
 @require_auth
@@ -413,7 +861,7 @@ def create_appointment():
         return jsonify({'error': 'assessment_id required'}), 400
 
     try:
-        a = chats.find_one({'_id': ObjectId(assessment_id), 'user_id': g.user_id, 'type': 'assessment'})
+        a = _find_chat({'_id': ObjectId(assessment_id), 'user_id': g.user_id, 'type': 'assessment'})
     except Exception:
         return jsonify({'error': 'invalid assessment id'}), 400
 
@@ -452,24 +900,31 @@ def create_appointment():
 @require_auth
 @require_role('doctor')
 def list_appointments():
-    docs = list(appointments.find())
-    enriched = []
-    for d in docs:
-        # attach patient name/email when available
-        patient_id = d.get('patient_id')
-        patient_info = None
-        try:
-            if patient_id:
-                patient_info = users.find_one({'_id': ObjectId(patient_id)}, {'password': 0})
-        except Exception:
-            patient_info = None
-        if patient_info:
-            d['patient_name'] = patient_info.get('name')
-            d['patient_email'] = patient_info.get('email')
-        d['_id'] = str(d['_id'])
-        d['created_at'] = d.get('created_at').isoformat() if d.get('created_at') else None
-        enriched.append(d)
-    return jsonify({'appointments': enriched})
+    try:
+        projection = _requested_projection(APPOINTMENT_SUMMARY_FIELDS, required=('patient_id',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def enriched():
+        cursor = appointments.find({}, projection).batch_size(PATIENT_LOOKUP_BATCH)
+        while True:
+            batch = list(islice(cursor, PATIENT_LOOKUP_BATCH))
+            if not batch:
+                return
+            # attach patient name/email when available, one users query per batch
+            ids = {d['patient_id'] for d in batch if ObjectId.is_valid(d.get('patient_id') or '')}
+            patients = {
+                str(u['_id']): u
+                for u in users.find({'_id': {'$in': [ObjectId(i) for i in ids]}}, {'name': 1, 'email': 1})
+            } if ids else {}
+            for d in batch:
+                patient_info = patients.get(d.get('patient_id'))
+                if patient_info:
+                    d['patient_name'] = patient_info.get('name')
+                    d['patient_email'] = patient_info.get('email')
+                d.setdefault('created_at', None)
+                yield d
+    return stream_json_array('appointments', enriched())
 
 
 @chat_bp.route('/appointments/<appointment_id>', methods=['GET'])
@@ -485,7 +940,7 @@ def get_appointment(appointment_id):
     # if appointment was created before snapshot was stored, try to fetch assessment
     if 'assessment_snapshot' not in a and a.get('assessment_id'):
         try:
-            ass = chats.find_one({'_id': ObjectId(a['assessment_id']), 'type': 'assessment'})
+            ass = _find_chat({'_id': ObjectId(a['assessment_id']), 'type': 'assessment'})
             if ass:
                 a['assessment_snapshot'] = {
                     'form': ass.get('form', {}),
@@ -503,14 +958,7 @@ def get_appointment(appointment_id):
             a['patient_email'] = patient.get('email')
     except Exception:
         pass
-    # convert datetimes to isoformat for JSON
-    if 'created_at' in a and hasattr(a['created_at'], 'isoformat'):
-        a['created_at'] = a['created_at'].isoformat()
-    if 'assessment_snapshot' in a:
-        # nothing else to do; assessment snapshot contains plain data
-        pass
-    a['_id'] = str(a['_id'])
-    return jsonify({'appointment': a})
+    return json_response({'appointment': a})
 
 
 @chat_bp.route('/appointments/<appointment_id>/status', methods=['PUT'])
@@ -536,7 +984,7 @@ def update_appointment_status(appointment_id):
     if status == 'accepted' and note:
         appt = appointments.find_one({'_id': ObjectId(appointment_id)})
         if appt:
-            chats.insert_one({
+            chat_writer.insert({
                 'user_id': appt['patient_id'],
                 'question': None,
                 'answer': f"Appointment update: {note}",
@@ -548,24 +996,179 @@ def update_appointment_status(appointment_id):
     return jsonify({'message': 'updated'})
 
 
+SSE_PREAMBLE = 'retry: 3000\n\n'
+SSE_RESYNC = 'event: resync\ndata: {}\n\n'
+_EVENT_SUMMARIES = {
+    'chats': dict.fromkeys(CHAT_SUMMARY_FIELDS, 1),
+    'appointments': dict.fromkeys(APPOINTMENT_SUMMARY_FIELDS, 1),
+}
+
+
+def event_keys(user_id: str, role: str, patient_id=None) -> list:
+    """Event hub subscription keys for a user (see utils/events.py)."""
+    keys = [('user', user_id)]
+    if role == 'doctor':
+        keys.append(('role', 'doctor'))
+        if patient_id:
+            keys.append(('patient', patient_id))
+    return keys
+
+
+def sse_frame(event) -> str:
+    """Encode a hub event (or None, meaning the heartbeat timed out) as an SSE frame."""
+    if event is None:
+        return ': keep-alive\n\n'
+    # the event dict is shared between subscribers; project into a copy
+    payload = dict(event, document=_project(event['document'], _EVENT_SUMMARIES[event['collection']]))
+    return f"event: {event['type']}\ndata: {dumps(payload).decode('utf-8')}\n\n"
+
+
+@chat_bp.route('/events', methods=['GET'])
+@require_auth
+def events():
+    """Server-sent events for new/updated appointments and chat entries.
+
+    Patients receive their own chat entries and appointment updates; doctors
+    receive every appointment event and, with ?patient_id=, that patient's chat
+    entries. Documents are sent in their summary view. A `resync` event means
+    the client fell behind and should reload.
+    """
+    sub = event_hub.subscribe(event_keys(g.user_id, g.role, request.args.get('patient_id')))
+
+    def stream():
+        try:
+            yield SSE_PREAMBLE
+            while True:
+                event = sub.get(timeout=EVENTS_HEARTBEAT)
+                if sub.overflowed:
+                    yield SSE_RESYNC
+                    return
+                yield sse_frame(event)
+        finally:
+            event_hub.unsubscribe(sub)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers=headers)
+
+
+@chat_bp.route('/events/token', methods=['POST'])
+@require_auth
+def events_token():
+    """A short-lived token for /events?token= (the login token never goes in a URL)."""
+    return jsonify({'token': issue_events_token(g.user_id), 'expires_in': EVENTS_TOKEN_TTL})
+
+
 # Doctor endpoints
 @chat_bp.route('/patient/<patient_id>/history', methods=['GET'])
 @require_auth
 @require_role('doctor')
 def patient_history(patient_id):
-    docs = list(chats.find({'user_id': patient_id}).sort('timestamp', 1))
-    for d in docs:
-        d['_id'] = str(d['_id'])
-        if 'timestamp' in d and hasattr(d['timestamp'], 'isoformat'):
-            d['timestamp'] = d['timestamp'].isoformat()
-    return jsonify({'history': docs})
+    return _history_response(patient_id)
+
+
+@chat_bp.route('/patient/<patient_id>/search', methods=['GET'])
+@require_auth
+@require_role('doctor')
+def search_patient_history(patient_id):
+    """Full-text search over a patient's questions, answers, advice and reported symptoms.
+
+    ?q= takes words, "quoted phrases" and -excluded words; ?page= and ?limit=
+    paginate. Hot entries are ranked by Mongo's text index; archived entries
+    follow, newest first. Each hit carries <mark>-highlighted, HTML-escaped snippets.
+    """
+    q = (request.args.get('q') or '').strip()
+    terms, excluded = parse_query(q)
+    if not terms:
+        return jsonify({'error': 'q parameter with at least one search term required'}), 400
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'page and limit must be integers'}), 400
+
+    skip = (page - 1) * limit
+    hits = chat_store.search(patient_id, q, skip + limit + 1)
+    if chat_archive.has(patient_id):
+        archived = (d for d in chat_archive.iter_user_desc(patient_id) if matches(d, terms, excluded))
+        hits = chain(hits, archived)
+    window = list(islice(hits, skip, skip + limit + 1))
+
+    results = [{
+        '_id': d['_id'],
+        'type': d.get('type', 'chat'),
+        'from_role': d.get('from_role'),
+        'timestamp': d.get('timestamp') or d.get('created_at'),
+        'score': d.get('score'),
+        'archived': 'score' not in d,
+        'highlights': highlight(d, terms),
+    } for d in window[:limit]]
+    return json_response({'hits': results, 'query': q, 'page': page, 'limit': limit,
+                          'has_more': len(window) > limit})
+
+
+def _flag(name: str) -> bool:
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def _patient_records(patient_id: str):
+    # _id order is insertion order and keeps the cursor on an index instead of an in-memory sort;
+    # archived (older) turns come first
+    return chain(chat_archive.iter_user(patient_id),
+                 chat_store.history(patient_id, order='_id', batch_size=EXPORT_BATCH_SIZE))
+
+
+def _buffer_unavailable():
+    # the write-behind buffer could not be written to Mongo, so reads there would miss acknowledged turns
+    return jsonify({'error': 'Database unavailable, retry shortly'}), 503, {'Retry-After': '1'}
+
+
+@chat_bp.route('/patient/<patient_id>/export', methods=['GET'])
+@require_auth
+@require_role('doctor')
+def export_patient_history(patient_id):
+    """Stream a patient's complete chat and assessment record as NDJSON (?gzip=1 to compress)."""
+    if not chat_writer.flush():
+        return _buffer_unavailable()
+    return ndjson_response(_patient_records(patient_id), f'patient-{patient_id}.ndjson', gzip=_flag('gzip'))
+
+
+@chat_bp.route('/appointments/export', methods=['GET'])
+@require_auth
+@require_role('doctor')
+def export_appointment_queue():
+    """Stream every appointment (optionally ?status=pending) followed by its patient's records.
+
+    Each line carries record_type 'appointment' or 'chat'; a patient with several
+    appointments in the queue has their records exported once.
+    """
+    query = {}
+    if request.args.get('status'):
+        query['status'] = request.args['status']
+
+    def records():
+        exported = set()
+        for appt in appointments.find(query).sort('_id', 1).batch_size(EXPORT_BATCH_SIZE):
+            appt['record_type'] = 'appointment'
+            yield appt
+            patient_id = appt.get('patient_id')
+            if not patient_id or patient_id in exported:
+                continue
+            exported.add(patient_id)
+            for doc in _patient_records(patient_id):
+                doc['record_type'] = 'chat'
+                yield doc
+
+    if not chat_writer.flush():
+        return _buffer_unavailable()
+    name = f"appointments-{query.get('status', 'all')}.ndjson"
+    return ndjson_response(records(), name, gzip=_flag('gzip'))
 
 
 @chat_bp.route('/assessments/<assessment_id>', methods=['GET'])
 @require_auth
 def get_assessment(assessment_id):
     try:
-        ass = chats.find_one({'_id': ObjectId(assessment_id), 'type': 'assessment'})
+        ass = _find_chat({'_id': ObjectId(assessment_id), 'type': 'assessment'})
     except Exception:
         return jsonify({'error': 'invalid id'}), 400
     if not ass:
@@ -573,10 +1176,7 @@ def get_assessment(assessment_id):
     # allow patients to view their own assessment or doctors to view any
     if g.role != 'doctor' and str(ass.get('user_id')) != g.user_id:
         return jsonify({'error': 'Forbidden'}), 403
-    ass['_id'] = str(ass['_id'])
-    if 'created_at' in ass and hasattr(ass['created_at'], 'isoformat'):
-        ass['created_at'] = ass['created_at'].isoformat()
-    return jsonify({'assessment': ass})
+    return json_response({'assessment': ass})
 
 @chat_bp.route('/patient/<patient_id>/suggest', methods=['POST'])
 @require_auth
@@ -587,7 +1187,7 @@ def patient_suggest(patient_id):
     if not suggestion:
         return jsonify({'error': 'suggestion required'}), 400
 
-    chats.insert_one({
+    chat_writer.insert({
         'user_id': patient_id,
         'question': None,
         'answer': suggestion,
@@ -597,6 +1197,11 @@ def patient_suggest(patient_id):
     return jsonify({'message': 'Suggestion saved'})
 
 
+def _flush_buffered(oid) -> bool:
+    """Edits go straight to Mongo, so write a still-buffered message first; False if that failed."""
+    return not chat_writer.get(oid) or chat_writer.flush()
+
+
 @chat_bp.route('/message/<message_id>', methods=['PUT'])
 @require_auth
 def update_message(message_id):
@@ -605,9 +1210,12 @@ def update_message(message_id):
     rerun = data.get('rerun', False)
 
     try:
-        doc = chats.find_one({'_id': ObjectId(message_id)})
+        oid = ObjectId(message_id)
     except Exception:
         return jsonify({'error': 'invalid id'}), 400
+    if not _flush_buffered(oid):
+        return _buffer_unavailable()
+    doc = chat_store.find_one({'_id': oid})
     if not doc:
         return jsonify({'error': 'Not found'}), 404
 
@@ -628,7 +1236,7 @@ def update_message(message_id):
         update_fields['timestamp'] = datetime.utcnow()
 
     if update_fields:
-        chats.update_one({'_id': ObjectId(message_id)}, {'$set': update_fields})
+        chat_store.update_fields(oid, update_fields)
 
     return jsonify({'message': 'updated'})
 
@@ -637,9 +1245,12 @@ def update_message(message_id):
 @require_auth
 def delete_message(message_id):
     try:
-        doc = chats.find_one({'_id': ObjectId(message_id)})
+        oid = ObjectId(message_id)
     except Exception:
         return jsonify({'error': 'invalid id'}), 400
+    if not _flush_buffered(oid):
+        return _buffer_unavailable()
+    doc = chat_store.find_one({'_id': oid})
     if not doc:
         return jsonify({'error': 'Not found'}), 404
 
@@ -647,11 +1258,19 @@ def delete_message(message_id):
     if str(doc.get('user_id')) != g.user_id and not (g.role == 'doctor' and doc.get('from_role') == 'doctor' and str(doc.get('doctor_id')) == g.user_id):
         return jsonify({'error': 'Forbidden'}), 403
 
-    chats.delete_one({'_id': ObjectId(message_id)})
+    chat_store.delete(oid)
     return jsonify({'message': 'deleted'})
 
 
 # Medicine Information endpoints
+@chat_bp.route('/router/stats', methods=['GET'])
+@require_auth
+@require_role('doctor')
+def router_stats():
+    """How many /ask questions the catalog fast path answered, by intent and fall-through reason."""
+    return jsonify(intent_router.stats())
+
+
 @chat_bp.route('/medicines', methods=['GET'])
 def list_medicines():
     """Get list of all available medicines."""
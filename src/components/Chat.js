@@ -22,7 +22,7 @@ export default function Chat(){
 
   async function refreshHistory(){
     try{
-      const res = await api().get('/api/chat/history');
+      const res = await api().get('/api/chat/history?view=summary');
       setMessages(res.data.history || []);
     }catch(e){/*ignore*/}
   }
@@ -60,6 +60,38 @@ export default function Chat(){
     window.location.href = '/login';
   }
 
+  // live updates: doctor notes and replies arrive as chat events
+  useEffect(()=>{
+    if(!localStorage.getItem('token') || typeof EventSource === 'undefined') return;
+    let es = null, stopped = false;
+    const onChat = (e)=>{
+      const doc = JSON.parse(e.data).document;
+      setMessages(prev => {
+        const idx = prev.findIndex(m => m._id === doc._id);
+        if(idx === -1) return [...prev, doc];
+        const next = prev.slice();
+        next[idx] = Object.assign({}, prev[idx], doc);
+        return next;
+      });
+    };
+    // the URL carries a short-lived stream token (never the login token); get a fresh one per connection
+    async function open(){
+      try{
+        const res = await api().post('/api/chat/events/token');
+        if(stopped) return;
+        es = new EventSource(`/api/chat/events?token=${encodeURIComponent(res.data.token)}`);
+        es.addEventListener('chat.created', onChat);
+        es.addEventListener('chat.updated', onChat);
+        es.addEventListener('resync', ()=>refreshHistory());
+        es.onerror = ()=>{ if(es.readyState === EventSource.CLOSED && !stopped) setTimeout(open, 3000); };
+      }catch(err){
+        if(!stopped && err.response?.status !== 401) setTimeout(open, 5000);
+      }
+    }
+    open();
+    return ()=>{ stopped = true; if(es) es.close(); };
+  },[]);
+
   useEffect(()=>{
     (async()=>{
       await refreshHistory();
@@ -19,7 +19,7 @@ export default function DoctorDashboard(){
   async function load(){
     setLoading(true);
     try{
-      const res = await api().get('/api/chat/appointments');
+      const res = await api().get('/api/chat/appointments?view=summary');
       let appts = res.data.appointments || [];
       if(showOnlyUrgent){
         appts = appts.filter(a => (a.assessment_snapshot && ['critical','urgent'].includes(a.assessment_snapshot.severity)));
@@ -37,6 +37,40 @@ export default function DoctorDashboard(){
 
   useEffect(()=>{ load(); },[showOnlyUrgent]);
 
+  // live updates: merge appointment events instead of reloading the whole list
+  useEffect(()=>{
+    if(!localStorage.getItem('token') || typeof EventSource === 'undefined') return;
+    let es = null, stopped = false;
+    const onAppointment = (e)=>{
+      const appt = JSON.parse(e.data).document;
+      const urgent = appt.assessment_snapshot && ['critical','urgent'].includes(appt.assessment_snapshot.severity);
+      setAppointments(prev => {
+        if(showOnlyUrgent && !urgent) return prev.filter(a => a._id !== appt._id);
+        const idx = prev.findIndex(a => a._id === appt._id);
+        if(idx === -1) return [...prev, appt];
+        const next = prev.slice();
+        next[idx] = Object.assign({}, prev[idx], appt);
+        return next;
+      });
+    };
+    // the URL carries a short-lived stream token (never the login token); get a fresh one per connection
+    async function open(){
+      try{
+        const res = await api().post('/api/chat/events/token');
+        if(stopped) return;
+        es = new EventSource(`/api/chat/events?token=${encodeURIComponent(res.data.token)}`);
+        es.addEventListener('appointment.created', onAppointment);
+        es.addEventListener('appointment.updated', onAppointment);
+        es.addEventListener('resync', ()=>load());
+        es.onerror = ()=>{ if(es.readyState === EventSource.CLOSED && !stopped) setTimeout(open, 3000); };
+      }catch(err){
+        if(!stopped && err.response?.status !== 401) setTimeout(open, 5000);
+      }
+    }
+    open();
+    return ()=>{ stopped = true; if(es) es.close(); };
+  },[showOnlyUrgent]);
+
   const [showReportFor, setShowReportFor] = useState(null);
   const [reportData, setReportData] = useState(null);
 
@@ -62,7 +96,7 @@ export default function DoctorDashboard(){
 
   async function viewHistory(patientId){
     try{
-      const res = await api().get(`/api/chat/patient/${patientId}/history`);
+      const res = await api().get(`/api/chat/patient/${patientId}/history?view=summary`);
       setHistoryData(res.data.history || []);
       setHistoryFor(patientId);
     }catch(err){
@@ -73,7 +107,8 @@ export default function DoctorDashboard(){
   async function updateStatus(id, status, note=''){
     try{
       await api().put(`/api/chat/appointments/${id}/status`, { status, note });
-      load();
+      // with live events the updated appointment arrives on its own
+      if(typeof EventSource === 'undefined') load();
       // if appointment accepted and doctor wrote a note, auto-open patient chat
       if(status === 'accepted' && note){
         alert('Appointment accepted and patient notified.');
@@ -1,4 +1,9 @@
 import os
+import sys
+import json
+import math
+import time
+import platform
 import argparse
 import torch
 from pathlib import Path
@@ -11,6 +16,14 @@ import argparse
 
 parser = argparse.ArgumentParser(description='Test a local model folder for inference')
 parser.add_argument('--model_path', type=str, help='Path to local model folder (overrides env MODEL_PATH)')
+parser.add_argument('--benchmark', action='store_true', help='Run the benchmark grid instead of the interactive loop')
+parser.add_argument('--batch_sizes', type=str, default='1,4,8', help='Benchmark: comma-separated batch sizes')
+parser.add_argument('--num_beams', type=str, default='1,4', help='Benchmark: comma-separated beam counts')
+parser.add_argument('--max_new_tokens', type=str, default='64,200', help='Benchmark: comma-separated output lengths')
+parser.add_argument('--prompts_file', type=str, help='Benchmark: prompts, one per line (default: built-in set)')
+parser.add_argument('--repeats', type=int, default=5, help='Benchmark: timed runs per configuration')
+parser.add_argument('--warmup', type=int, default=1, help='Benchmark: untimed runs per configuration')
+parser.add_argument('--json', type=str, default='benchmark_results.json', help='Benchmark: JSON results file')
 args = parser.parse_args()
 
 # Candidate paths (you can set MODEL_PATH env var or pass --model_path)
@@ -92,6 +105,124 @@ tokenizer = AutoTokenizer.from_pretrained(str(BASE_MODEL_PATH), local_files_only
 print("🔽 Loading model...")
 model = AutoModelForSeq2SeqLM.from_pretrained(str(BASE_MODEL_PATH), local_files_only=True)
 model.to(device)
+model.eval()
+
+# -------------------------------
+# Benchmark mode
+# -------------------------------
+BENCH_PROMPTS = [
+    "What are the common symptoms of seasonal flu?",
+    "I have had a dry cough and mild fever for three days. What should I do?",
+    "What is the usual adult dosage of paracetamol?",
+    "Explain the difference between type 1 and type 2 diabetes.",
+    "My child has a rash on the arms after eating peanuts. Is this an allergy?",
+    "How can I lower my blood pressure without medication?",
+    "What are the side effects of ibuprofen and who should avoid it?",
+    "When should chest pain be treated as an emergency?",
+]
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _ints(csv):
+    return [int(x) for x in csv.split(',') if x.strip()]
+
+
+def _pct(values, p):
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(p / 100 * len(s)) - 1))]  # nearest rank
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+def _sync():
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def _timed_generate(inputs, **gen_kwargs):
+    _sync()
+    started = time.perf_counter()
+    with torch.no_grad():
+        outputs = model.generate(**inputs, **gen_kwargs)
+    _sync()
+    return time.perf_counter() - started, outputs
+
+
+def _new_tokens(outputs):
+    # decoder output: start token, then generated tokens, padded after EOS
+    pad = tokenizer.pad_token_id
+    return int((outputs[:, 1:] != pad).sum()) if pad is not None else outputs[:, 1:].numel()
+
+
+def run_benchmark():
+    prompts = BENCH_PROMPTS
+    if args.prompts_file:
+        with open(args.prompts_file, encoding='utf-8') as fh:
+            prompts = [line.strip() for line in fh if line.strip()]
+    results = []
+    for batch_size in _ints(args.batch_sizes):
+        batch = [prompts[i % len(prompts)] for i in range(batch_size)]
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
+        for num_beams in _ints(args.num_beams):
+            for max_new_tokens in _ints(args.max_new_tokens):
+                gen = dict(max_new_tokens=max_new_tokens, num_beams=num_beams, do_sample=False)
+                for _ in range(args.warmup):
+                    _timed_generate(inputs, **gen)
+                # encoder pass + first decoder step: what a streaming client would wait for
+                ttft = [_timed_generate(inputs, **dict(gen, max_new_tokens=1))[0] for _ in range(args.repeats)]
+                latencies, tokens = [], 0
+                for _ in range(args.repeats):
+                    elapsed, outputs = _timed_generate(inputs, **gen)
+                    latencies.append(elapsed)
+                    tokens += _new_tokens(outputs)
+                row = {
+                    'batch_size': batch_size, 'num_beams': num_beams, 'max_new_tokens': max_new_tokens,
+                    'runs': args.repeats,
+                    'ttft_ms_p50': round(_pct(ttft, 50) * 1000, 1),
+                    'latency_ms_p50': round(_pct(latencies, 50) * 1000, 1),
+                    'latency_ms_p95': round(_pct(latencies, 95) * 1000, 1),
+                    'latency_ms_p99': round(_pct(latencies, 99) * 1000, 1),
+                    'tokens_per_sec': round(tokens / sum(latencies), 1),
+                    'peak_rss_mb': _peak_rss_mb(),  # process-wide high-water mark so far
+                }
+                if device.type == 'cuda':
+                    row['peak_cuda_mb'] = round(torch.cuda.max_memory_allocated() / 2 ** 20, 1)
+                results.append(row)
+                print(f"bs={batch_size:<3} beams={num_beams:<2} new={max_new_tokens:<4} "
+                      f"ttft={row['ttft_ms_p50']:>8.1f}ms p50={row['latency_ms_p50']:>8.1f}ms "
+                      f"p95={row['latency_ms_p95']:>8.1f}ms p99={row['latency_ms_p99']:>8.1f}ms "
+                      f"{row['tokens_per_sec']:>7.1f} tok/s rss={row['peak_rss_mb']}MB", file=sys.stderr)
+
+    report = {
+        'model_path': str(BASE_MODEL_PATH),
+        'device': str(device),
+        'gpu': torch.cuda.get_device_name(0) if device.type == 'cuda' else None,
+        'torch': torch.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_threads': torch.get_num_threads(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'prompts': len(prompts),
+        'results': results,
+    }
+    with open(args.json, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Results written to {args.json}", file=sys.stderr)
+
+
+if args.benchmark:
+    print("⏱️ Running benchmark...", file=sys.stderr)
+    run_benchmark()
+    sys.exit(0)
 
 # -------------------------------
 # Main loop for user input
@@ -0,0 +1,71 @@
+"""Train the intent/urgency triage classifier used to route requests.
+
+    python train_triage.py --csv_path healthcare_chatbot_dataset_large.csv
+
+Reads the dataset through train.HealthcareChatDataset, fits a TF-IDF + logistic
+regression model on user_input and symptoms against the user_intent and
+urgency_level columns, reports held-out accuracy and saves the bundle to
+TRIAGE_MODEL_PATH, where the backend picks it up on the next start.
+"""
+import os
+import time
+import argparse
+import logging
+import joblib
+import pandas as pd
+from sklearn.metrics import classification_report
+from sklearn.model_selection import train_test_split
+from config import TRIAGE_MODEL_PATH
+from train import HealthcareChatDataset
+from utils.triage import TriageClassifier, fit_triage_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_examples(csv_path: str, max_samples: int = None):
+    df = HealthcareChatDataset(csv_path).df
+    if max_samples and len(df) > max_samples:
+        df = df.iloc[:max_samples]
+    # same text the backend classifies: the question, plus reported symptoms when there are any
+    texts = (df['user_input'].fillna('').astype(str) + ' ' + df['symptoms'].fillna('').astype(str)).str.strip()
+    # same defaults as HealthcareChatDataset.create_conversation_pairs
+    intents = df['user_intent'].where(pd.notna(df['user_intent']), 'general').astype(str)
+    urgencies = df['urgency_level'].where(pd.notna(df['urgency_level']), 'medium').astype(str)
+    keep = texts.str.len() > 0
+    return texts[keep].tolist(), intents[keep].tolist(), urgencies[keep].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the intent/urgency triage classifier')
+    parser.add_argument('--csv_path', type=str, default=os.getenv('DATA_PATH', 'healthcare_chatbot_dataset_large.csv'), help='Path to dataset CSV')
+    parser.add_argument('--output', type=str, default=TRIAGE_MODEL_PATH, help='Where to save the classifier')
+    parser.add_argument('--max_samples', type=int, default=None, help='Limit samples for faster runs')
+    parser.add_argument('--max_features', type=int, default=50000, help='TF-IDF vocabulary size')
+    parser.add_argument('--test_size', type=float, default=0.1, help='Held-out fraction for evaluation')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_path):
+        logger.error(f"Dataset not found at {args.csv_path}")
+        raise FileNotFoundError(args.csv_path)
+
+    texts, intents, urgencies = load_examples(args.csv_path, args.max_samples)
+    split = train_test_split(texts, intents, urgencies, test_size=args.test_size, random_state=42)
+    X_train, X_test, i_train, i_test, u_train, u_test = split
+    logger.info(f"Training on {len(X_train)} examples, evaluating on {len(X_test)}")
+
+    started = time.perf_counter()
+    bundle = fit_triage_model(X_train, i_train, u_train, max_features=args.max_features)
+    logger.info(f"Trained in {time.perf_counter() - started:.1f}s")
+
+    preds = TriageClassifier(bundle=bundle).predict(X_test)
+    logger.info("Intent:\n" + classification_report(i_test, [p.intent for p in preds], zero_division=0))
+    logger.info("Urgency:\n" + classification_report(u_test, [p.urgency for p in preds], zero_division=0))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    joblib.dump(bundle, args.output)
+    logger.info(f"Saved triage classifier to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Admission control for the model-backed endpoints (/ask, /assess).
+
+Every model request takes a ticket before it may queue for the model and
+returns it when done. A request is turned away straight away, instead of
+waiting until it times out, when:
+
+  - the user already has ADMISSION_PER_USER_CONCURRENCY requests in flight  -> 429
+  - ADMISSION_MAX_QUEUE requests are already admitted                      -> 503
+  - the estimated wait (requests ahead / MODEL_CONCURRENCY * average model
+    request time) exceeds ADMISSION_MAX_WAIT                               -> 503
+  - the user's token bucket (ADMISSION_RATE per second, ADMISSION_BURST) is
+    empty                                                                  -> 429
+
+Critical requests (e.g. an /assess whose rule-based severity is critical)
+are not shed behind routine traffic: they may use ADMISSION_CRITICAL_RESERVE
+places beyond ADMISSION_MAX_QUEUE and skip the estimated-wait check, since the
+scheduler serves them first. Per-user limits still apply to them.
+
+Rejections carry a Retry-After header. Cheap endpoints never take a ticket,
+so they are unaffected by model overload.
+"""
+import math
+import time
+import threading
+from contextlib import contextmanager
+from flask import jsonify
+from config import (
+    MODEL_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT, ADMISSION_PER_USER_CONCURRENCY,
+    ADMISSION_RATE, ADMISSION_BURST, ADMISSION_INITIAL_SERVICE_TIME, ADMISSION_CRITICAL_RESERVE
+)
+
+EWMA_ALPHA = 0.2  # weight of the newest request time in the running average
+MAX_IDLE_BUCKETS = 10000  # full (idle) token buckets are dropped beyond this many users
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, message: str, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def headers(self) -> dict:
+        return {'Retry-After': str(self.retry_after)}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    def __init__(self, concurrency, max_queue, max_wait, per_user, rate, burst, initial_service_time,
+                 critical_reserve=0):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.critical_reserve = critical_reserve
+        self.max_wait = max_wait
+        self.per_user = per_user
+        self.rate = rate
+        self.burst = burst
+        self.service_time = initial_service_time
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._per_user = {}
+        self._buckets = {}
+        self.rejected = {'user_concurrency': 0, 'queue_full': 0, 'wait_too_long': 0, 'rate_limited': 0}
+        self.completed = 0
+
+    def estimated_wait(self) -> float:
+        """Seconds a request admitted now would wait before reaching the model."""
+        ahead = max(0, self._admitted - self.concurrency + 1)
+        return ahead / self.concurrency * self.service_time
+
+    def try_admit(self, user_id: str, priority: str = None):
+        """Take a ticket for user_id or raise AdmissionRejected. Pair with release()."""
+        critical = priority == 'critical'
+        with self._lock:
+            if self._per_user.get(user_id, 0) >= self.per_user:
+                self.rejected['user_concurrency'] += 1
+                raise AdmissionRejected(429, 'Too many requests in progress for this user', self.service_time)
+            if self._admitted >= self.max_queue + (self.critical_reserve if critical else 0):
+                self.rejected['queue_full'] += 1
+                raise AdmissionRejected(503, 'Model queue is full, retry shortly', self.estimated_wait())
+            wait = self.estimated_wait()
+            if wait > self.max_wait and not critical:
+                self.rejected['wait_too_long'] += 1
+                raise AdmissionRejected(503, 'Model is overloaded, retry shortly', wait - self.max_wait)
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                    self._buckets = {u: b for u, b in self._buckets.items() if not b.full()}
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            retry = bucket.take()
+            if retry:
+                self.rejected['rate_limited'] += 1
+                raise AdmissionRejected(429, 'Rate limit exceeded', retry)
+            self._admitted += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+
+    def release(self, user_id: str, elapsed: float = None):
+        with self._lock:
+            self._admitted -= 1
+            left = self._per_user.get(user_id, 1) - 1
+            if left:
+                self._per_user[user_id] = left
+            else:
+                self._per_user.pop(user_id, None)
+            if elapsed is not None:
+                self.completed += 1
+                self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+
+    @contextmanager
+    def ticket(self, user_id: str, priority: str = None):
+        """try_admit/release around a block; AdmissionRejected propagates before it runs."""
+        self.try_admit(user_id, priority)
+        started = time.monotonic()
+        elapsed = None
+        try:
+            yield
+            elapsed = time.monotonic() - started
+        finally:
+            self.release(user_id, elapsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'admitted': self._admitted,
+                'max_queue': self.max_queue,
+                'critical_reserve': self.critical_reserve,
+                'estimated_wait': round(self.estimated_wait(), 3),
+                'avg_service_time': round(self.service_time, 3),
+                'completed': self.completed,
+                'rejected': dict(self.rejected),
+            }
+
+
+model_admission = AdmissionController(
+    MODEL_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT, ADMISSION_PER_USER_CONCURRENCY,
+    ADMISSION_RATE, ADMISSION_BURST, ADMISSION_INITIAL_SERVICE_TIME, ADMISSION_CRITICAL_RESERVE
+)
+
+
+def rejection_response(e: AdmissionRejected):
+    return jsonify({'error': e.message}), e.status, e.headers()
@@ -0,0 +1,215 @@
+"""Precomputed answers for the most frequent questions, served from a memory-mapped file.
+
+`build_answer_store.py` mines recent chats for the top questions per role,
+generates their answers offline and writes them here; generate_answer looks a
+question up before touching the model. The file is read-only once written:
+
+    MAGIC | meta length (u32) | count (u32) | meta JSON
+    index: count x (key hash u64, offset u64, length u32), sorted by hash
+    data:  per entry, key UTF-8 | NUL | answer UTF-8
+
+A lookup is a binary search over the mmapped index plus one slice, so the
+store costs no Python heap however large it gets and all worker processes
+share the same page cache. Rebuilds write a new file and os.replace it into
+place (on Windows the backend must be stopped for the swap); readers notice
+the new file within ANSWER_STORE_CHECK_INTERVAL. A store built for another
+model version (see model_version) is ignored.
+"""
+import os
+import re
+import json
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from utils.metrics import cache_lookup
+from config import MODEL_PATH, BASE_MODEL, ANSWER_STORE_PATH, ANSWER_STORE_CHECK_INTERVAL
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'MEDANS01'
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<QQI')
+_PUNCT = re.compile(r'[^\w\s]+')
+_version = None
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, punctuation dropped, whitespace collapsed: 'What is a fever??' -> 'what is a fever'."""
+    return ' '.join(_PUNCT.sub(' ', question.lower()).split())
+
+
+def store_key(role: str, question: str) -> bytes:
+    return f"{role}\x1f{normalize_question(question)}".encode('utf-8')
+
+
+def _hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def model_fingerprint(path: str) -> str:
+    """<folder name>-<hash of file names, sizes and mtimes> for a local model; a hub name as is."""
+    if not os.path.isdir(path):
+        return path
+    h = hashlib.blake2b(digest_size=8)
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            st = os.stat(os.path.join(root, name))
+            h.update(f"{os.path.relpath(os.path.join(root, name), path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return f"{os.path.basename(os.path.normpath(path))}-{h.hexdigest()}"
+
+
+def model_version() -> str:
+    """Identifies the weights generate_answer serves: MODEL_PATH when present, else BASE_MODEL."""
+    global _version
+    if _version is None:
+        _version = model_fingerprint(MODEL_PATH if MODEL_PATH and os.path.isdir(MODEL_PATH) else BASE_MODEL)
+    return _version
+
+
+def write_answer_store(path: str, entries, meta: dict) -> int:
+    """Write (role, question, answer) entries to path atomically; returns the entry count."""
+    records = {}
+    for role, question, answer in entries:
+        records[store_key(role, question)] = answer.encode('utf-8')
+    keyed = sorted((_hash(k), k, v) for k, v in records.items())
+    meta = dict(meta, count=len(keyed), built_at=datetime.utcnow().isoformat())
+    meta_bytes = json.dumps(meta).encode('utf-8')
+
+    offset = HEADER.size + len(meta_bytes) + ENTRY.size * len(keyed)
+    index, data = [], []
+    for h, k, v in keyed:
+        blob = k + b'\x00' + v
+        index.append(ENTRY.pack(h, offset, len(blob)))
+        data.append(blob)
+        offset += len(blob)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, len(meta_bytes), len(keyed)))
+        fh.write(meta_bytes)
+        fh.write(b''.join(index))
+        fh.write(b''.join(data))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)  # readers see the old file or the new one, never a partial write
+    return len(keyed)
+
+
+class _Mapped:
+    __slots__ = ('map', 'meta', 'count', 'index_at')
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as fh:
+            self.map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_len, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an answer store")
+        self.meta = json.loads(self.map[HEADER.size:HEADER.size + meta_len])
+        self.index_at = HEADER.size + meta_len
+
+    def get(self, key: bytes):
+        h = _hash(key)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ENTRY.unpack_from(self.map, self.index_at + mid * ENTRY.size)[0] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        # equal hashes are adjacent; the stored key settles collisions
+        while lo < self.count:
+            eh, offset, length = ENTRY.unpack_from(self.map, self.index_at + lo * ENTRY.size)
+            if eh != h:
+                return None
+            blob = self.map[offset:offset + length]
+            k, _, v = blob.partition(b'\x00')
+            if k == key:
+                return v.decode('utf-8')
+            lo += 1
+        return None
+
+
+class AnswerStore:
+    def __init__(self, path: str, check_interval: float = ANSWER_STORE_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._stamp = None
+        self._checked = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stale = False  # file present but built for another model version
+
+    def _current(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._mapped
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return self._mapped
+            self._checked = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._mapped, self._stamp = None, None
+                return None
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stamp != self._stamp:
+                self._stamp = stamp
+                # the previous map is not closed here: a concurrent lookup may still hold it,
+                # and it is unmapped once the last reference goes away
+                self._mapped = None
+                try:
+                    mapped = _Mapped(self.path)
+                except (OSError, ValueError) as e:
+                    log.warning(f"Could not open answer store {self.path}: {e}")
+                    return None
+                self.stale = mapped.meta.get('model_version') != model_version()
+                if self.stale:
+                    log.warning(f"Answer store {self.path} was built for {mapped.meta.get('model_version')}, "
+                                f"serving {model_version()}; ignoring it until it is rebuilt")
+                else:
+                    log.info(f"Loaded {mapped.count} precomputed answers from {self.path}")
+                    self._mapped = mapped
+            return self._mapped
+
+    def get(self, role: str, question: str, profile: str = 'default'):
+        """The precomputed answer for (role, question), or None.
+
+        Answers are only served to callers asking for the decoding profile the
+        store was built with (a 'brief' request must not get a 'default' answer).
+        """
+        mapped = self._current()
+        if mapped is None:
+            return None
+        answer = None
+        if mapped.meta.get('profile', 'default') == profile:
+            answer = mapped.get(store_key(role, question))
+        cache_lookup('answer_store', hit=answer is not None)
+        # plain int updates; an occasional lost increment is fine for stats
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def stats(self) -> dict:
+        mapped = self._current()
+        return {
+            'loaded': mapped is not None,
+            'stale': self.stale,
+            'entries': mapped.count if mapped else 0,
+            'built_at': mapped.meta.get('built_at') if mapped else None,
+            'profile': mapped.meta.get('profile') if mapped else None,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+answer_store = AnswerStore(ANSWER_STORE_PATH)
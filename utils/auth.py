@@ -1,35 +1,75 @@
 import jwt
+from datetime import datetime, timedelta
 from flask import request, jsonify, g
 from functools import wraps
-from config import SECRET_KEY
+from config import SECRET_KEY, EVENTS_TOKEN_TTL
 from db.mongo import users
+from utils.tracing import identify, span
 from bson.objectid import ObjectId
 
 
+EVENTS_PURPOSE = 'events'
+
+
+def issue_events_token(user_id: str) -> str:
+    """Short-lived token that only opens an event stream.
+
+    EventSource cannot set headers, so the stream's token goes in the URL,
+    where access logs and proxies record it; the login token must not.
+    """
+    exp = datetime.utcnow() + timedelta(seconds=EVENTS_TOKEN_TTL)
+    return jwt.encode({'user_id': user_id, 'purpose': EVENTS_PURPOSE, 'exp': exp}, SECRET_KEY, algorithm='HS256')
+
+
+def query_token(token, accept: str):
+    """'Bearer <token>' for a ?token= on an event-stream request, else None."""
+    return 'Bearer ' + token if token and 'text/event-stream' in (accept or '') else None
+
+
+def decode_bearer(auth, purpose: str = None):
+    """(user_id, None) for a valid 'Bearer <jwt>' header value, else (None, error message).
+
+    purpose: the token's single purpose (EVENTS_PURPOSE for ?token=); None means a
+    login token, so purpose-bound tokens are not accepted in the Authorization header.
+    """
+    if not auth:
+        return None, 'Authorization header missing'
+    parts = auth.split()
+    if parts[0].lower() != 'bearer' or len(parts) != 2:
+        return None, 'Invalid authorization header'
+    try:
+        payload = jwt.decode(parts[1], SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        return None, 'Token expired'
+    except Exception:
+        return None, 'Invalid token'
+    if payload.get('purpose') != purpose:
+        return None, 'Invalid token'
+    return payload['user_id'], None
+
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         auth = request.headers.get('Authorization', None)
+        purpose = None
         if not auth:
-            return jsonify({'error': 'Authorization header missing'}), 401
-        parts = auth.split()
-        if parts[0].lower() != 'bearer' or len(parts) != 2:
-            return jsonify({'error': 'Invalid authorization header'}), 401
-        token = parts[1]
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
-        except Exception:
-            return jsonify({'error': 'Invalid token'}), 401
-
-        user = users.find_one({'_id': ObjectId(payload['user_id'])})
+            # EventSource cannot set headers, so SSE requests pass an /events/token as ?token=
+            auth = query_token(request.args.get('token'), request.headers.get('Accept'))
+            purpose = EVENTS_PURPOSE if auth else None
+        with span('auth'):
+            user_id, error = decode_bearer(auth, purpose)
+            user = None if error else users.find_one({'_id': ObjectId(user_id)})
+        if error:
+            return jsonify({'error': error}), 401
+
         if not user:
             return jsonify({'error': 'User not found'}), 401
 
         g.user = user
         g.user_id = str(user['_id'])
         g.role = user.get('role', 'patient')
+        identify(g.user_id, g.role)
         return f(*args, **kwargs)
     return decorated
 
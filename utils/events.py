@@ -0,0 +1,194 @@
+"""Live events for new/updated appointments and chats.
+
+A single watcher thread follows the `appointments` collection and the chat
+store (`chats`, or `chat_buckets` in bucket mode) and fans documents out to
+subscriber queues (one per SSE connection). It uses a database-level change
+stream when Mongo supports it (replica set / Atlas) and falls back to tailing
+by _id / updated_at on a standalone local mongod.
+"""
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from config import EVENTS_POLL_INTERVAL, EVENTS_POLL_LAG, EVENTS_QUEUE_SIZE
+from db.mongo import db, appointments
+from db.chat_store import chat_store
+
+log = logging.getLogger(__name__)
+
+WATCHED = ('appointments', chat_store.collection_name)
+CHANGE_STREAM_UNSUPPORTED = (40573, 40415)  # standalone server / unknown $changeStream stage
+RECENT_IDS = 10000  # de-duplication window for the polling fallback
+
+
+def _audiences(collection: str, doc: dict):
+    """Subscription keys an event about doc is delivered to."""
+    if collection == 'appointments':
+        return [('role', 'doctor'), ('user', doc.get('patient_id'))]
+    # chats: the owning patient, and doctors following that patient
+    return [('user', doc.get('user_id')), ('patient', doc.get('user_id'))]
+
+
+class Subscription:
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.queue = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        """Called from the watcher thread; must not block."""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # slow consumer: tell it to reload instead of blocking the watcher
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event dict, or None after timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Subscription consumed from an asyncio event loop (see asgi.py)."""
+
+    def __init__(self, keys, loop):
+        self.keys = set(keys)
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+        self._loop = loop
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def offer(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # loop already closed
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}  # key -> set of Subscription
+        self._thread = None
+        self.mode = None  # 'change_stream' or 'polling' once running
+
+    def subscribe(self, keys, loop=None) -> Subscription:
+        """Register for events; pass the running asyncio loop to get an AsyncSubscription."""
+        sub = AsyncSubscription(keys, loop) if loop is not None else Subscription(keys)
+        with self._lock:
+            for k in sub.keys:
+                self._subs.setdefault(k, set()).add(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for k in sub.keys:
+                subs = self._subs.get(k)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[k]
+
+    def publish(self, event_type: str, collection: str, doc: dict):
+        event = {'type': event_type, 'collection': collection, 'document': doc}
+        with self._lock:
+            targets = set()
+            for k in _audiences(collection, doc):
+                targets |= self._subs.get(k, set())
+        for sub in targets:
+            sub.offer(event)
+
+    # -- watcher ----------------------------------------------------------
+
+    def _run(self):
+        try:
+            self.mode = 'change_stream'
+            self._watch_change_stream()
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                log.info("Change streams unavailable (standalone mongod?); falling back to polling")
+            else:
+                log.warning(f"Change stream failed ({e}); falling back to polling")
+        self.mode = 'polling'
+        self._poll()
+
+    def _watch_change_stream(self):
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': list(WATCHED)},
+            'operationType': {'$in': ['insert', 'update', 'replace']},
+        }}]
+        resume_token = None
+        while True:
+            try:
+                with db.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        if change['ns']['coll'] == 'appointments':
+                            doc = change.get('fullDocument')
+                            if doc:
+                                kind = 'created' if change['operationType'] == 'insert' else 'updated'
+                                self.publish(f"appointment.{kind}", 'appointments', doc)
+                            continue
+                        for kind, doc in chat_store.messages_from_change(change):
+                            self.publish(f"chat.{kind}", 'chats', doc)
+            except OperationFailure:
+                raise
+            except PyMongoError as e:
+                log.warning(f"Change stream interrupted, resuming: {e}")
+                time.sleep(EVENTS_POLL_INTERVAL)
+
+    def _poll(self):
+        lag = timedelta(seconds=EVENTS_POLL_LAG)
+        since = datetime.utcnow()
+        seen = deque(maxlen=RECENT_IDS)
+        seen_set = set()
+
+        def emit(event_type, coll, doc, key):
+            if key in seen_set:
+                return
+            if len(seen) == seen.maxlen:
+                seen_set.discard(seen[0])
+            seen.append(key)
+            seen_set.add(key)
+            self.publish(event_type, coll, doc)
+
+        while True:
+            now = datetime.utcnow()
+            # look back a little: write-behind assigns _ids before the document reaches Mongo
+            floor = ObjectId.from_datetime(since - lag)
+            try:
+                for doc in appointments.find({'_id': {'$gt': floor}}).sort('_id', 1):
+                    emit('appointment.created', 'appointments', doc, doc['_id'])
+                for doc in chat_store.recent(floor, since - lag):
+                    emit('chat.created', 'chats', doc, doc['_id'])
+                for doc in appointments.find({'updated_at': {'$gt': since - lag}}):
+                    emit('appointment.updated', 'appointments', doc, (doc['_id'], doc['updated_at']))
+                since = now
+            except PyMongoError as e:
+                log.warning(f"Event polling failed: {e}")
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+
+event_hub = EventHub()
@@ -0,0 +1,119 @@
+"""Rule-based fast path for medicine-information questions on /ask.
+
+Questions such as "what is the dosage of cetirizine" or "side effects of
+omeprazole" are plain catalog lookups: when a question names exactly one
+medicine from the database, asks about one of its catalog fields, and carries
+nothing personal that the model should weigh (own symptoms, pregnancy,
+children, other drugs, patient context), it is answered from the database
+without a generation. Everything else falls through to the model.
+"""
+import re
+import threading
+
+# (intent, pattern) in order of precedence; `info` is the catch-all "tell me about X"
+INTENT_PATTERNS = [
+    ('side_effects', re.compile(r'\bside[\s-]?effects?\b|\badverse\b|\breactions?\b')),
+    ('max_daily', re.compile(r'\bmax(imum)?\b|\bdaily (limit|max)\b|\bper day\b|\bin a day\b')),
+    ('dosage', re.compile(r'\bdos(e|es|age|ing)\b|\bhow (much|many|often)\b|\bmg\b')),
+    ('precautions', re.compile(r'\bprecautions?\b|\bwarnings?\b|\bcontraindications?\b|\bwho should(n.t| not)\b')),
+    ('uses', re.compile(r'\bused? (for|to)\b|\buses\b|\bwhat does .+ (treat|do)\b|\bgood for\b')),
+    ('info', re.compile(r'^(what is|what\'s|what are|tell me about|info(rmation)? (on|about)|about)\b')),
+]
+
+# anything personal or comparative needs clinical judgement, i.e. the model
+PERSONAL = re.compile(
+    r'\b(i|i\'m|im|my|mine|we|our|son|daughter|child|children|kid|kids|baby|infant|toddler|'
+    r'pregnan\w*|breastfeed\w*|nursing|elderly|allerg\w*|interact\w*|combine|mix|together|instead|'
+    r'overdose|took|taken|should|safe|better|vs|versus|or)\b'
+)
+MAX_WORDS = 16  # longer questions usually carry context the catalog can't answer
+
+INTENT_FIELDS = {
+    'side_effects': ('side_effects', 'Possible side effects of {name}: {value}.'),
+    'max_daily': ('max_daily', 'Maximum daily amount of {name}: {value}.'),
+    'dosage': ('dosage', 'Typical adult dosage of {name}: {value}.'),
+    'precautions': ('precautions', 'Use {name} with caution if you have: {value}.'),
+    'uses': ('uses', '{name} is commonly used for: {value}.'),
+    'info': (None, None),
+}
+DISCLAIMER = 'This is general product information; check the label and ask a pharmacist or doctor about your own situation.'
+
+
+class RoutedAnswer:
+    __slots__ = ('answer', 'intent', 'medicine')
+
+    def __init__(self, answer, intent, medicine):
+        self.answer = answer
+        self.intent = intent
+        self.medicine = medicine
+
+
+class IntentRouter:
+    def __init__(self, database: dict, formatter):
+        """database: name -> catalog entry (MEDICINE_DATABASE); formatter: name -> display card."""
+        self.database = database
+        self.formatter = formatter
+        names = sorted(database, key=len, reverse=True)  # longest first: 'saline nasal spray' before 'saline'
+        self._names = re.compile(r'\b(' + '|'.join(re.escape(n) for n in names) + r')\b')
+        self._lock = threading.Lock()
+        self.counts = {'total': 0, 'answered': 0}
+        self.by_intent = {intent: 0 for intent, _ in INTENT_PATTERNS}
+        self.fallthrough = {'no_medicine': 0, 'several_medicines': 0, 'personal': 0, 'no_intent': 0,
+                            'too_long': 0, 'has_context': 0}
+
+    def classify(self, question: str, context=None, catalog_hint: bool = False):
+        """(intent, medicine, None) for a catalog lookup, else (None, None, fall-through reason).
+
+        catalog_hint: the triage classifier labelled the question a medicine lookup,
+        so a lone medicine name without a recognised phrasing counts as `info`.
+        """
+        q = ' '.join(question.lower().replace('?', ' ').split())
+        if isinstance(context, dict) and any(context.get(k) for k in ('medications', 'conditions', 'symptoms', 'allergies')):
+            return None, None, 'has_context'
+        if len(q.split()) > MAX_WORDS:
+            return None, None, 'too_long'
+        meds = set(self._names.findall(q))
+        if not meds:
+            return None, None, 'no_medicine'
+        if len(meds) > 1:
+            return None, None, 'several_medicines'
+        if PERSONAL.search(q):
+            return None, None, 'personal'
+        for intent, pattern in INTENT_PATTERNS:
+            if pattern.search(q):
+                return intent, meds.pop(), None
+        if catalog_hint:
+            return 'info', meds.pop(), None
+        return None, None, 'no_intent'
+
+    def route(self, question: str, context=None, catalog_hint: bool = False):
+        """A RoutedAnswer when the question can be answered from the catalog, else None."""
+        intent, med, reason = self.classify(question, context, catalog_hint)
+        with self._lock:
+            self.counts['total'] += 1
+            if intent is None:
+                self.fallthrough[reason] += 1
+            else:
+                self.counts['answered'] += 1
+                self.by_intent[intent] += 1
+        if intent is None:
+            return None
+        field, template = INTENT_FIELDS[intent]
+        parts = []
+        if field:
+            value = self.database[med][field]
+            parts.append(template.format(name=med.title(), value=', '.join(value) if isinstance(value, list) else value))
+        parts.append(self.formatter(med).strip())
+        parts.append(DISCLAIMER)
+        return RoutedAnswer('\n\n'.join(parts), intent, med)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.counts['total']
+            return {
+                'total': total,
+                'answered': self.counts['answered'],
+                'answered_fraction': round(self.counts['answered'] / total, 4) if total else 0.0,
+                'by_intent': dict(self.by_intent),
+                'fallthrough': dict(self.fallthrough),
+            }
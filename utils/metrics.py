@@ -0,0 +1,138 @@
+"""Prometheus metrics, served at /metrics.
+
+Needs `pip install prometheus_client`; without it every metric below is a
+no-op and /metrics answers 501. Under a multi-process server (e.g. gunicorn
+workers) set PROMETHEUS_MULTIPROC_DIR to an empty directory before starting:
+each worker then writes its samples to files there and /metrics merges all
+workers (call mark_process_dead from gunicorn's child_exit hook).
+
+Ratios are left to PromQL, e.g. tokens/sec is
+rate(model_generated_tokens_total[5m]) and a cache hit ratio is
+rate(cache_requests_total{result="hit"}[5m]) / rate(cache_requests_total[5m]).
+"""
+import os
+import time
+from contextlib import contextmanager
+from flask import Response, g, jsonify, request
+from utils.tracing import span
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, multiprocess
+except ImportError:  # optional dependency
+    prometheus_client = None
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir'))
+REQUEST_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+MONGO_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5)
+enabled = prometheus_client is not None
+
+
+class _NoMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _metric(kind: str, name, documentation, labels=(), **kwargs):
+    return getattr(prometheus_client, kind)(name, documentation, labels, **kwargs) if enabled else _NoMetric()
+
+
+REQUEST_LATENCY = _metric('Histogram', 'http_request_duration_seconds',
+                          'Time to produce the response (streamed bodies: until the first byte)',
+                          ('blueprint', 'route', 'method', 'status'), buckets=REQUEST_BUCKETS)
+REQUESTS_IN_FLIGHT = _metric('Gauge', 'http_requests_in_flight', 'Requests being handled',
+                             ('blueprint',), multiprocess_mode='livesum')
+MODEL_QUEUE_DEPTH = _metric('Gauge', 'model_queue_depth', 'Generations waiting for a model slot',
+                            ('priority',), multiprocess_mode='livesum')
+MODEL_SLOTS_BUSY = _metric('Gauge', 'model_slots_busy', 'Model slots running a generation',
+                           multiprocess_mode='livesum')
+MODEL_QUEUE_WAIT = _metric('Histogram', 'model_queue_wait_seconds', 'Wait for a model slot',
+                           ('priority',), buckets=REQUEST_BUCKETS)
+MODEL_STAGE = _metric('Histogram', 'model_stage_seconds',
+                      'generate_answer stages: tokenize, generate, decode, postprocess',
+                      ('stage',), buckets=REQUEST_BUCKETS)
+GENERATED_TOKENS = _metric('Counter', 'model_generated_tokens', 'Tokens produced by model.generate', ('profile',))
+MONGO_LATENCY = _metric('Histogram', 'mongo_command_duration_seconds', 'Mongo command round trips',
+                        ('collection', 'command', 'outcome'), buckets=MONGO_BUCKETS)
+CACHE_REQUESTS = _metric('Counter', 'cache_requests', 'Cache lookups by result (hit/miss)', ('cache', 'result'))
+
+
+@contextmanager
+def model_stage(stage: str):
+    """Time a generate_answer stage, both in the histogram and as a trace span."""
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        MODEL_STAGE.labels(stage).observe(time.perf_counter() - started)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+@contextmanager
+def request_in_flight(blueprint: str):
+    REQUESTS_IN_FLIGHT.labels(blueprint).inc()
+    try:
+        yield
+    finally:
+        REQUESTS_IN_FLIGHT.labels(blueprint).dec()
+
+
+def observe_request(blueprint: str, route: str, method: str, status: int, seconds: float):
+    REQUEST_LATENCY.labels(blueprint, route, method, str(status)).observe(seconds)
+
+
+def mark_process_dead(pid: int):
+    """For gunicorn's child_exit hook: drop a dead worker's live gauges."""
+    if enabled and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def metrics_view():
+    if not enabled:
+        return jsonify({'error': 'Metrics need prometheus_client (pip install prometheus_client)'}), 501
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+def init_app(app):
+    """Time every request by blueprint and route template, and serve /metrics."""
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_blueprint = request.blueprint or '-'
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(g.metrics_blueprint).inc()
+
+    @app.after_request
+    def _observe_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            observe_request(g.metrics_blueprint, route, request.method, response.status_code,
+                            time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _end_request_metrics(exc):
+        blueprint = g.pop('metrics_blueprint', None)
+        if blueprint is not None:
+            REQUESTS_IN_FLIGHT.labels(blueprint).dec()
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
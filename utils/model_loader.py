@@ -1,10 +1,16 @@
 import os
+import hashlib
 import logging
 import re
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from config import MODEL_PATH, BASE_MODEL
+from config import MODEL_PATH, BASE_MODEL, GENERATION_BATCH_SIZE
+from utils.answer_store import answer_store
+from utils.metrics import GENERATED_TOKENS, model_stage
+from utils.tracing import span
+from utils.singleflight import SingleFlight
+from utils.scheduler import DEFAULT_PRIORITY, model_scheduler
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -14,6 +20,31 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 # Lazy load variables
 _tokenizer = None
 _model = None
+# identical prompts in flight at the same time share one generation
+generation_flight = SingleFlight('generation')
+
+# Decoding settings per profile; utils/triage.py picks 'brief' for casual questions
+DECODING_PROFILES = {
+    'default': dict(
+        max_length=512,  # Increased for more detailed responses
+        num_beams=5,  # Improved beam search
+        temperature=0.7,  # Better balance between diversity and quality
+        do_sample=True,  # Allow sampling for more natural text
+        top_p=0.9,  # Nucleus sampling
+        repetition_penalty=1.8,  # Softer penalty
+        no_repeat_ngram_size=4,
+        early_stopping=True,
+        length_penalty=1.0
+    ),
+    'brief': dict(
+        max_length=192,
+        num_beams=2,
+        do_sample=False,
+        repetition_penalty=1.8,
+        no_repeat_ngram_size=4,
+        early_stopping=True
+    ),
+}
 
 
 def _load_base():
@@ -43,6 +74,13 @@ def _load_base():
         _model = None
 
 
+def load_model() -> bool:
+    """Load the tokenizer and model now instead of on the first request; False if none is available."""
+    if _tokenizer is None or _model is None:
+        _load_base()
+    return _tokenizer is not None and _model is not None
+
+
 # Simple medication caution list (extend as needed)
 _MED_WARNING = {
     'ibuprofen': 'Caution: Nonsteroidal anti-inflammatory drugs (e.g., ibuprofen) may increase blood pressure or interact with antihypertensive drugs. Consult your doctor or pharmacist before taking.'
@@ -84,22 +122,7 @@ def _apply_med_warnings(question: str, generated: str, context: Optional[Dict] =
     return generated
 
 
-def generate_answer(question: str, role: str = 'patient', context: Optional[Dict] = None) -> str:
-    """Generate an answer with enhanced role-aware prompting for realistic, detailed responses.
-
-    Args:
-      question: user question text
-      role: 'patient' or 'doctor' (affects prompt style)
-      context: optional dict with keys like 'medications', 'conditions', 'symptoms'
-    """
-    global _tokenizer, _model
-    if _tokenizer is None or _model is None:
-        _load_base()
-
-    if _tokenizer is None or _model is None:
-        logger.warning("No model available; returning canned response")
-        return "Sorry, model unavailable right now. Please try again later."
-
+def _build_prompt(question: str, role: str = 'patient', context: Optional[Dict] = None) -> str:
     # Enhanced role-aware instruction prompts with better structure
     if role == 'patient':
         role_instruction = (
@@ -123,38 +146,132 @@ def generate_answer(question: str, role: str = 'patient', context: Optional[Dict
         if 'allergies' in context and context['allergies']:
             context_str += 'Allergies: ' + context['allergies'] + '. '
 
-    prompt = (
+    return (
         role_instruction + '\n\n' +
         'CONTEXT: ' + (context_str if context_str else 'General medical information request') + '\n\n' +
         'QUESTION: ' + question + '\n\n' +
         'RESPONSE: Provide a thorough, practical answer with specific details and guidance.'
     )
 
+
+def _flight_key(prompt: str) -> bytes:
+    # case and whitespace differences don't change what the model is asked
+    return hashlib.sha256(' '.join(prompt.lower().split()).encode('utf-8')).digest()
+
+
+def _generated_tokens(outputs) -> int:
+    try:
+        body = outputs[:, 1:]  # each sequence starts with the decoder start token
+    except TypeError:  # stand-in models (loadtest/stubs.py) return text
+        return 0
+    pad = _tokenizer.pad_token_id
+    return int((body != pad).sum()) if pad is not None else body.numel()
+
+
+def _generate_raw(prompt: str, priority: str = DEFAULT_PRIORITY, profile: str = 'default') -> str:
+    """Run the model on a prompt and return the decoded text, before any post-processing."""
     # Tokenize and generate with balanced parameters for quality responses
-    inputs = _tokenizer(prompt, return_tensors='pt', truncation=True, padding=True, max_length=512).to(device)
-    with torch.no_grad():
-        outputs = _model.generate(
-            **inputs,
-            max_length=512,  # Increased for more detailed responses
-            num_beams=5,  # Improved beam search
-            temperature=0.7,  # Better balance between diversity and quality
-            do_sample=True,  # Allow sampling for more natural text
-            top_p=0.9,  # Nucleus sampling
-            repetition_penalty=1.8,  # Softer penalty
-            no_repeat_ngram_size=4,
-            early_stopping=True,
-            length_penalty=1.0
-        )
-    raw = _tokenizer.decode(outputs[0], skip_special_tokens=True)
+    with model_stage('tokenize'):
+        inputs = _tokenizer(prompt, return_tensors='pt', truncation=True, padding=True, max_length=512).to(device)
+    # concurrent generate() calls on one model only slow each other down; wait for a slot by priority
+    with model_scheduler.slot(priority), torch.no_grad(), model_stage('generate'):
+        outputs = _model.generate(**inputs, **DECODING_PROFILES.get(profile, DECODING_PROFILES['default']))
+    GENERATED_TOKENS.labels(profile).inc(_generated_tokens(outputs))
+    with model_stage('decode'):
+        return _tokenizer.decode(outputs[0], skip_special_tokens=True)
 
-    # Lighter post-processing to preserve useful information
-    cleaned = _collapse_repetition(raw)
-    cleaned = _apply_med_warnings(question, cleaned, context)
 
-    # Lenient truncation - preserve complete thoughts
-    if len(cleaned) > 3000:
-        cleaned = cleaned[:3000].rsplit('. ', 1)[0] + '.'
+def _generate_raw_batch(prompts: List[str], priority: str = DEFAULT_PRIORITY, profile: str = 'default') -> List[str]:
+    """_generate_raw for several prompts in one padded model.generate call."""
+    with model_stage('tokenize'):
+        inputs = _tokenizer(prompts, return_tensors='pt', truncation=True, padding=True, max_length=512).to(device)
+    with model_scheduler.slot(priority), torch.no_grad(), model_stage('generate'):
+        outputs = _model.generate(**inputs, **DECODING_PROFILES.get(profile, DECODING_PROFILES['default']))
+    GENERATED_TOKENS.labels(profile).inc(_generated_tokens(outputs))
+    with model_stage('decode'):
+        return _tokenizer.batch_decode(outputs, skip_special_tokens=True)
 
-    return cleaned.strip()
 
+def _postprocess(raw: str, question: str, context: Optional[Dict] = None) -> str:
+    with model_stage('postprocess'):
+        # Lighter post-processing to preserve useful information
+        cleaned = _collapse_repetition(raw)
+        cleaned = _apply_med_warnings(question, cleaned, context)
+
+        # Lenient truncation - preserve complete thoughts
+        if len(cleaned) > 3000:
+            cleaned = cleaned[:3000].rsplit('. ', 1)[0] + '.'
+
+        return cleaned.strip()
+
+
+def generate_answer(question: str, role: str = 'patient', context: Optional[Dict] = None,
+                    priority: str = DEFAULT_PRIORITY, profile: str = 'default') -> str:
+    """Generate an answer with enhanced role-aware prompting for realistic, detailed responses.
+
+    Questions without context are first looked up in the precomputed answer
+    store (utils/answer_store.py). Concurrent calls that build the same prompt
+    share one generation (see utils/singleflight.py); post-processing still
+    runs per call.
+
+    Args:
+      question: user question text
+      role: 'patient' or 'doctor' (affects prompt style)
+      context: optional dict with keys like 'medications', 'conditions', 'symptoms'
+      priority: scheduling class for the model queue ('critical', 'urgent' or 'routine')
+      profile: decoding settings from DECODING_PROFILES
+    """
+    if not context:
+        stored = answer_store.get(role, question, profile)
+        if stored is not None:
+            return stored
+
+    global _tokenizer, _model
+    if _tokenizer is None or _model is None:
+        _load_base()
+
+    if _tokenizer is None or _model is None:
+        logger.warning("No model available; returning canned response")
+        return "Sorry, model unavailable right now. Please try again later."
+
+    prompt = _build_prompt(question, role, context)
+    # 'model' covers waiting for a slot (or for a shared generation) plus the generate_answer stages
+    with span('model', priority=priority, profile=profile):
+        raw = generation_flight.do(_flight_key(profile + '\n' + prompt), _generate_raw, prompt, priority, profile)
+    return _postprocess(raw, question, context)
+
+
+def generate_answers(questions: List[str], role: str = 'patient', contexts: Optional[List[Optional[Dict]]] = None,
+                     priority: str = DEFAULT_PRIORITY, profile: str = 'default',
+                     batch_size: int = GENERATION_BATCH_SIZE, precomputed: bool = True) -> List[str]:
+    """generate_answer for many questions, batch_size prompts per model.generate call.
+
+    Batching trades a little latency for much higher throughput on bulk work
+    (e.g. /triage/bulk); interactive requests should keep using generate_answer.
+    precomputed=False skips the answer store (used when rebuilding it).
+    """
+    contexts = contexts or [None] * len(questions)
+    answers = [None] * len(questions)
+    if precomputed:
+        answers = [None if c else answer_store.get(role, q, profile) for q, c in zip(questions, contexts)]
+    todo = [i for i, a in enumerate(answers) if a is None]
+    if not todo:
+        return answers
+
+    global _tokenizer, _model
+    if _tokenizer is None or _model is None:
+        _load_base()
+
+    if _tokenizer is None or _model is None:
+        logger.warning("No model available; returning canned responses")
+        for i in todo:
+            answers[i] = "Sorry, model unavailable right now. Please try again later."
+        return answers
 
+    prompts = [_build_prompt(questions[i], role, contexts[i]) for i in todo]
+    raws = []
+    for i in range(0, len(prompts), batch_size):
+        raws.extend(_generate_raw_batch(prompts[i:i + batch_size], priority, profile))
+    for i, raw in zip(todo, raws):
+        answers[i] = _postprocess(raw, questions[i], contexts[i])
+    return answers
@@ -0,0 +1,126 @@
+"""Priority scheduling of model generations.
+
+MODEL_CONCURRENCY generations run at once; waiting requests are queued per
+priority class and dispatched by weighted fair queuing: each request gets a
+virtual finish tag of max(virtual time, class's last tag) + 1 / weight, and the
+smallest tag runs next. With the default weights a critical assessment is
+served about 8 times as often as a routine question when both are backlogged,
+while routine traffic still makes progress.
+
+Anti-starvation: a waiting request's tag is lowered by SCHEDULER_AGING_RATE
+per second of waiting, so an old routine request eventually beats a stream of
+fresh high-priority ones.
+"""
+import time
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from config import MODEL_CONCURRENCY, SCHEDULER_WEIGHTS, SCHEDULER_AGING_RATE
+from utils.metrics import MODEL_QUEUE_DEPTH, MODEL_QUEUE_WAIT, MODEL_SLOTS_BUSY
+
+DEFAULT_PRIORITY = 'routine'
+WAIT_SAMPLES = 1000  # recent waits kept per class for percentiles
+
+
+def priority_for(role: str = None, severity: str = None) -> str:
+    """Priority class of a model request: assessment severity first, then the asking role."""
+    if severity in ('critical', 'urgent'):
+        return severity
+    if role == 'doctor':
+        return 'urgent'
+    return DEFAULT_PRIORITY
+
+
+class _Waiter:
+    __slots__ = ('tag', 'enqueued', 'seq', 'granted')
+
+    def __init__(self, tag, seq):
+        self.tag = tag
+        self.enqueued = time.monotonic()
+        self.seq = seq
+        self.granted = False
+
+
+class PriorityScheduler:
+    def __init__(self, slots: int, weights: dict, aging_rate: float):
+        self.slots = max(1, slots)
+        self.weights = dict(weights)
+        self.aging_rate = aging_rate
+        self._cond = threading.Condition()
+        self._free = self.slots
+        self._queues = {c: deque() for c in self.weights}
+        self._last_tag = dict.fromkeys(self.weights, 0.0)
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._waits = {c: deque(maxlen=WAIT_SAMPLES) for c in self.weights}
+        self._served = dict.fromkeys(self.weights, 0)
+
+    @contextmanager
+    def slot(self, priority: str = DEFAULT_PRIORITY):
+        """Hold one of the model slots; waits for a turn according to priority."""
+        if priority not in self.weights:
+            priority = DEFAULT_PRIORITY
+        with self._cond:
+            tag = max(self._vtime, self._last_tag[priority]) + 1.0 / self.weights[priority]
+            self._last_tag[priority] = tag
+            waiter = _Waiter(tag, next(self._seq))
+            self._queues[priority].append(waiter)
+            MODEL_QUEUE_DEPTH.labels(priority).inc()
+            self._dispatch()
+            while not waiter.granted:
+                self._cond.wait()
+            waited = time.monotonic() - waiter.enqueued
+            self._waits[priority].append(waited)
+            self._served[priority] += 1
+        MODEL_QUEUE_DEPTH.labels(priority).dec()
+        MODEL_QUEUE_WAIT.labels(priority).observe(waited)
+        MODEL_SLOTS_BUSY.inc()
+        try:
+            yield
+        finally:
+            MODEL_SLOTS_BUSY.dec()
+            with self._cond:
+                self._free += 1
+                self._dispatch()
+
+    def _dispatch(self):
+        # caller holds self._cond
+        granted = False
+        while self._free:
+            now = time.monotonic()
+            best = None
+            for cls, q in self._queues.items():
+                if q:
+                    head = q[0]
+                    key = (head.tag - self.aging_rate * (now - head.enqueued), head.seq)
+                    if best is None or key < best[0]:
+                        best = (key, cls)
+            if best is None:
+                break
+            waiter = self._queues[best[1]].popleft()
+            self._vtime = max(self._vtime, waiter.tag)
+            waiter.granted = True
+            self._free -= 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Queue depth and wait times (seconds) per priority class."""
+        with self._cond:
+            classes = {}
+            for cls, waits in self._waits.items():
+                ordered = sorted(waits)
+                n = len(ordered)
+                classes[cls] = {
+                    'queued': len(self._queues[cls]),
+                    'served': self._served[cls],
+                    'wait_p50': round(ordered[n // 2], 4) if n else 0.0,
+                    'wait_p95': round(ordered[min(n - 1, int(n * 0.95))], 4) if n else 0.0,
+                    'wait_max': round(ordered[-1], 4) if n else 0.0,
+                }
+            return {'slots': self.slots, 'busy': self.slots - self._free, 'classes': classes}
+
+
+model_scheduler = PriorityScheduler(MODEL_CONCURRENCY, SCHEDULER_WEIGHTS, SCHEDULER_AGING_RATE)
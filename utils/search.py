@@ -0,0 +1,86 @@
+"""Query parsing, matching and highlighting for chat history search.
+
+Mongo's $text does the matching and scoring on hot data; these helpers parse
+the same query syntax (words, "quoted phrases", -excluded) to match archived
+turns and to build highlighted snippets for the hits.
+"""
+import re
+import html
+import shlex
+
+SEARCH_FIELDS = ('question', 'answer', 'advice', 'form.symptoms')
+SNIPPET_CONTEXT = 60  # characters kept on each side of the first match
+MARK_OPEN, MARK_CLOSE = '<mark>', '</mark>'
+
+
+def parse_query(q: str):
+    """Split a search string into (terms, excluded); quoted phrases stay whole."""
+    try:
+        parts = shlex.split(q)
+    except ValueError:  # unbalanced quote
+        parts = q.replace('"', ' ').split()
+    terms, excluded = [], []
+    for p in parts:
+        if p.startswith('-') and len(p) > 1:
+            excluded.append(p[1:].lower())
+        elif p:
+            terms.append(p.lower())
+    return terms, excluded
+
+
+def _term_pattern(terms):
+    # prefix match per word approximates Mongo's stemming ("cough" also marks "coughing")
+    alts = [r'\s+'.join(re.escape(w) for w in t.split()) + r'\w*' for t in terms]
+    return re.compile(r'\b(' + '|'.join(alts) + r')', re.IGNORECASE) if alts else None
+
+
+def field_value(doc: dict, path: str):
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc if isinstance(doc, str) else None
+
+
+def matches(doc: dict, terms, excluded) -> bool:
+    """Any term in any search field, and no excluded term anywhere (like $text)."""
+    text = ' '.join(filter(None, (field_value(doc, f) for f in SEARCH_FIELDS))).lower()
+    if not text:
+        return False
+    if any(re.search(r'\b' + re.escape(e), text) for e in excluded):
+        return False
+    pattern = _term_pattern(terms)
+    return bool(pattern and pattern.search(text))
+
+
+def highlight(doc: dict, terms) -> dict:
+    """{field: snippet} for fields containing a term, with matches wrapped in <mark>.
+
+    Snippets are HTML: the stored text is escaped, so only the <mark> tags are markup.
+    """
+    pattern = _term_pattern(terms)
+    out = {}
+    if not pattern:
+        return out
+    for f in SEARCH_FIELDS:
+        text = field_value(doc, f)
+        if not text:
+            continue
+        m = pattern.search(text)
+        if not m:
+            continue
+        start = max(0, m.start() - SNIPPET_CONTEXT)
+        end = min(len(text), m.end() + SNIPPET_CONTEXT)
+        snippet = _mark(pattern, text[start:end])
+        out[f] = ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+    return out
+
+
+def _mark(pattern, text: str) -> str:
+    parts, pos = [], 0
+    for m in pattern.finditer(text):
+        parts.append(html.escape(text[pos:m.start()]))
+        parts.append(MARK_OPEN + html.escape(m.group(0)) + MARK_CLOSE)
+        pos = m.end()
+    parts.append(html.escape(text[pos:]))
+    return ''.join(parts)
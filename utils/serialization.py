@@ -0,0 +1,122 @@
+"""JSON responses for Mongo documents.
+
+Uses orjson when it is installed (datetimes are serialized natively, in C) and
+falls back to the standard json module otherwise. ObjectId, Decimal128 and the
+other BSON types are handled in _default, so routes can hand documents straight
+from a cursor to the response without per-document conversion loops.
+"""
+import json
+import zlib
+import base64
+from datetime import datetime, date
+from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
+from bson.timestamp import Timestamp
+from bson.dbref import DBRef
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_DOCS = 200  # documents per chunk when streaming arrays
+NDJSON_CHUNK_BYTES = 64 * 1024  # flush NDJSON output once this much is buffered
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Timestamp):
+        return obj.as_datetime().isoformat()
+    if isinstance(obj, DBRef):
+        return {'$ref': obj.collection, '$id': _default(obj.id) if isinstance(obj.id, ObjectId) else obj.id}
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status: int = 200, headers: dict = None) -> Response:
+    """Serialize payload (which may contain raw Mongo documents) into a JSON response."""
+    return Response(dumps(payload), status=status, headers=headers, mimetype=JSON_MIMETYPE)
+
+
+def _iter_json_object(key: str, docs, extra: dict = None):
+    head = dumps(extra)[:-1] + b',' if extra else b'{'
+    yield head + dumps(key) + b':['
+    buf = []
+    first = True
+    for doc in docs:
+        buf.append(dumps(doc))
+        if len(buf) >= STREAM_CHUNK_DOCS:
+            yield (b'' if first else b',') + b','.join(buf)
+            first = False
+            buf = []
+    if buf:
+        yield (b'' if first else b',') + b','.join(buf)
+    yield b']}'
+
+
+def stream_json_array(key: str, docs, extra: dict = None, headers: dict = None) -> Response:
+    """Stream {"<key>": [doc, ...], **extra} without materializing the list.
+
+    docs can be any iterable, typically a pymongo cursor; documents are encoded
+    and sent in chunks of STREAM_CHUNK_DOCS.
+    """
+    return Response(stream_with_context(_iter_json_object(key, docs, extra)),
+                    headers=headers, mimetype=JSON_MIMETYPE)
+
+
+def iter_ndjson(docs, chunk_bytes: int = NDJSON_CHUNK_BYTES):
+    """Encode docs as newline-delimited JSON, yielding roughly chunk_bytes at a time."""
+    buf = []
+    size = 0
+    for doc in docs:
+        line = dumps(doc) + b'\n'
+        buf.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield b''.join(buf)
+
+
+def iter_gzip(chunks, level: int = 6):
+    """Gzip a stream of byte chunks incrementally (one compressor, constant memory)."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def ndjson_response(docs, filename: str, gzip: bool = False) -> Response:
+    """Stream docs as an NDJSON download, optionally gzip-compressed."""
+    body = iter_ndjson(docs)
+    if gzip:
+        body = iter_gzip(body)
+        filename += '.gz'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    return Response(stream_with_context(body), headers=headers,
+                    mimetype='application/gzip' if gzip else NDJSON_MIMETYPE)
@@ -0,0 +1,59 @@
+"""Single-flight: concurrent calls with the same key share one execution.
+
+The first caller for a key (the leader) runs the function; callers arriving
+while it runs wait for it and get the same result, or the same exception.
+Nothing is cached once the call finishes.
+"""
+import threading
+from utils.metrics import cache_lookup
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str = 'singleflight'):
+        self.name = name  # label of the cache_requests metric (a coalesced call counts as a hit)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+        cache_lookup(self.name, hit=not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executions': self.executions, 'coalesced': self.coalesced}
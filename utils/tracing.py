@@ -0,0 +1,150 @@
+"""Per-request tracing spans, exported as a Server-Timing header and a slow-request log.
+
+A trace is started for every request (init_app for Flask, asgi._timed for the
+native routes) and kept in a context variable, so code anywhere below the view
+can add spans without passing anything around:
+
+    with span('extract_meds'):
+        ...
+
+Spans are recorded for require_auth, the generate_answer stages (tokenize,
+generate, decode, postprocess, via utils.metrics.model_stage), write-behind
+inserts and every Mongo command issued from the request's thread (the
+CommandTimings listener in db/mongo.py). Outside a request span() is a no-op.
+
+The Server-Timing header sums spans of the same name (`mongo.users.find;dur=1.2;desc="x3"`),
+so it shows up in the browser's network panel. It exposes backend internals,
+so it is only sent to users authenticated with a role in
+TRACE_SERVER_TIMING_ROLES, or to everyone with the TRACE_SERVER_TIMING debug
+flag. Requests slower than
+TRACE_SLOW_REQUEST_MS are logged as one JSON line with every span on the
+`slow_requests` logger, for a TRACE_SLOW_SAMPLE_RATE fraction of them.
+For streamed responses both cover the time until the headers were sent.
+"""
+import json
+import time
+import random
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from config import (
+    TRACE_ENABLED, TRACE_SERVER_TIMING, TRACE_SERVER_TIMING_ROLES, TRACE_SLOW_REQUEST_MS, TRACE_SLOW_SAMPLE_RATE,
+    TRACE_MAX_SPANS,
+)
+
+slow_log = logging.getLogger('slow_requests')
+
+_current = ContextVar('trace', default=None)
+
+
+class Trace:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.user_id = None
+        self.role = None  # set by authentication (identify)
+        self.spans = []  # (name, start offset s, duration s, attrs); appended from any thread of the request
+        self.dropped = 0
+
+    def add(self, name: str, start: float, duration: float, attrs=None):
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, start - self.started, duration, attrs))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total: float) -> str:
+        totals = {}
+        for name, _, duration, _ in self.spans:
+            dur, count = totals.get(name, (0.0, 0))
+            totals[name] = (dur + duration, count + 1)
+        parts = [f'{name};dur={dur * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+                 for name, (dur, count) in totals.items()]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def to_dict(self, total: float, **fields) -> dict:
+        return {
+            'method': self.method,
+            'path': self.path,
+            'duration_ms': round(total * 1000, 1),
+            'user_id': self.user_id,
+            **fields,
+            'spans': [dict(name=name, start_ms=round(start * 1000, 1), dur_ms=round(duration * 1000, 1), **(attrs or {}))
+                      for name, start, duration, attrs in self.spans],
+            'dropped_spans': self.dropped,
+        }
+
+
+def begin(method: str, path: str):
+    """Start a trace for the current request; returns the token for end()."""
+    return _current.set(Trace(method, path)) if TRACE_ENABLED else None
+
+
+def current():
+    return _current.get()
+
+
+def end(token):
+    if token is not None:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, attrs or None)
+
+
+def identify(user_id: str, role: str):
+    """Attach the authenticated user to the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.user_id, trace.role = user_id, role
+
+
+def record(name: str, duration: float, **attrs):
+    """Add a span that ended just now and lasted duration seconds (for event listeners)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - duration, duration, attrs or None)
+
+
+def finish(trace, headers, **fields):
+    """Set Server-Timing on the response headers and log the trace if the request was slow."""
+    if trace is None:
+        return
+    total = trace.elapsed()
+    if TRACE_SERVER_TIMING or trace.role in TRACE_SERVER_TIMING_ROLES:
+        headers['Server-Timing'] = trace.server_timing(total)
+    if total * 1000 >= TRACE_SLOW_REQUEST_MS and random.random() < TRACE_SLOW_SAMPLE_RATE:
+        slow_log.warning(json.dumps(trace.to_dict(total, **fields), default=str))
+
+
+def init_app(app):
+    """Trace every Flask request."""
+
+    @app.before_request
+    def _begin_trace():
+        g.trace_token = begin(request.method, request.path)
+
+    @app.after_request
+    def _finish_trace(response):
+        finish(current(), response.headers, route=request.url_rule.rule if request.url_rule else None,
+               status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        end(g.pop('trace_token', None))
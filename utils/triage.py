@@ -0,0 +1,188 @@
+"""Lightweight intent/urgency classifier for routing requests.
+
+A TF-IDF vectorizer shared by two logistic-regression heads, trained on the
+`user_intent` and `urgency_level` columns of the chatbot dataset by
+`python train_triage.py`. Prediction is a sparse dot product: about 0.1 ms for
+a single text on CPU, and `predict` vectorizes a whole batch at once for a few
+tens of microseconds per text (see benchmarks/bench_triage.py).
+
+The predictions pick the scheduling priority and decoding profile of /ask
+generations, let the catalog fast path accept questions the classifier labels
+as medicine lookups, and give assess_severity a second opinion next to the
+RED_FLAGS rules. Without scikit-learn/joblib or a trained model file every
+prediction is None and the callers keep their rule-based behaviour.
+"""
+import os
+import math
+import logging
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+from config import (
+    TRIAGE_MODEL_PATH, TRIAGE_MIN_CONFIDENCE, TRIAGE_URGENCY_SEVERITY, TRIAGE_CATALOG_INTENTS,
+    TRIAGE_BRIEF_INTENTS
+)
+
+try:
+    import joblib
+    import numpy as np
+except ImportError:  # optional: only needed once a classifier has been trained
+    joblib = None
+
+log = logging.getLogger(__name__)
+
+BUNDLE_VERSION = 1
+SMALL_BATCH = 8  # up to this many texts are scored one by one, skipping sparse-matrix setup
+
+
+class TriagePrediction(NamedTuple):
+    intent: str
+    intent_confidence: float
+    urgency: str
+    urgency_confidence: float
+
+    @property
+    def severity(self) -> Optional[str]:
+        """assess_severity-style severity implied by the urgency label, if confident enough."""
+        if self.urgency_confidence < TRIAGE_MIN_CONFIDENCE:
+            return None
+        return TRIAGE_URGENCY_SEVERITY.get(str(self.urgency).lower())
+
+
+def fit_triage_model(texts, intents, urgencies, max_features: int = 50000) -> dict:
+    """Train the vectorizer and both heads; returns the bundle saved by train_triage.py."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    vectorizer = TfidfVectorizer(lowercase=True, ngram_range=(1, 2), min_df=2, sublinear_tf=True,
+                                 max_features=max_features, dtype=np.float32)
+    X = vectorizer.fit_transform(texts)
+    intent_head = LogisticRegression(max_iter=1000).fit(X, intents)
+    urgency_head = LogisticRegression(max_iter=1000).fit(X, urgencies)
+    return {'version': BUNDLE_VERSION, 'vectorizer': vectorizer, 'intent': intent_head, 'urgency': urgency_head}
+
+
+class _Head:
+    """A fitted LogisticRegression reduced to arrays, so scoring skips sklearn's input validation."""
+
+    def __init__(self, model):
+        self.classes = [str(c) for c in model.classes_]
+        self.weights = np.ascontiguousarray(model.coef_.T, dtype=np.float32)  # features x classes
+        self.bias = model.intercept_.astype(np.float32)
+
+    def proba(self, scores):
+        if scores.shape[1] == 1:  # binary: one logit for classes[1]
+            p = 1.0 / (1.0 + np.exp(-scores))
+            return np.hstack([1.0 - p, p])
+        scores = scores - scores.max(axis=1, keepdims=True)
+        e = np.exp(scores)
+        return e / e.sum(axis=1, keepdims=True)
+
+
+class TriageClassifier:
+    def __init__(self, path: str = None, bundle: dict = None):
+        self.path = path
+        self._bundle = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        if bundle is not None:
+            self._compile(bundle)
+            self._loaded = True
+
+    def _compile(self, bundle):
+        vectorizer = bundle['vectorizer']
+        self._vectorizer = vectorizer
+        self._analyzer = vectorizer.build_analyzer()
+        self._vocabulary = vectorizer.vocabulary_
+        self._idf = vectorizer.idf_.astype(np.float32)
+        self._heads = [_Head(bundle['intent']), _Head(bundle['urgency'])]
+        self._bundle = bundle
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                log.info(f"No triage classifier at {self.path}; using rules only")
+                return
+            if joblib is None:
+                log.warning("joblib is not installed; triage classifier disabled")
+                return
+            try:
+                bundle = joblib.load(self.path)
+            except Exception as e:
+                log.warning(f"Failed to load triage classifier from {self.path}: {e}")
+                return
+            if bundle.get('version') != BUNDLE_VERSION:
+                log.warning(f"Triage classifier at {self.path} has an unsupported format; retrain it")
+                return
+            self._compile(bundle)
+
+    @property
+    def available(self) -> bool:
+        if not self._loaded:
+            self._load()
+        return self._bundle is not None
+
+    def _features(self, text: str):
+        # same weighting as TfidfVectorizer(sublinear_tf=True, norm='l2') for one text
+        counts = Counter(t for t in self._analyzer(text) if t in self._vocabulary)
+        if not counts:
+            return None, None
+        idx = np.fromiter((self._vocabulary[t] for t in counts), dtype=np.int64, count=len(counts))
+        tf = np.fromiter((1.0 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+        w = tf * self._idf[idx]
+        return idx, w / np.linalg.norm(w)
+
+    def _scores(self, texts):
+        """Per head, a (len(texts) x classes) array of logits."""
+        if len(texts) <= SMALL_BATCH:
+            out = [np.tile(h.bias, (len(texts), 1)) for h in self._heads]
+            for row, text in enumerate(texts):
+                idx, w = self._features(text)
+                if idx is not None:
+                    for h, scores in zip(self._heads, out):
+                        scores[row] += w @ h.weights[idx]
+            return out
+        X = self._vectorizer.transform(texts)
+        return [np.asarray(X @ h.weights) + h.bias for h in self._heads]
+
+    def predict(self, texts) -> list:
+        """TriagePrediction per text (one vectorization and one matrix product per head), or Nones."""
+        texts = [t or '' for t in texts]
+        if not self.available or not texts:
+            return [None] * len(texts)
+        results = []
+        for head, scores in zip(self._heads, self._scores(texts)):
+            proba = head.proba(scores)
+            best = proba.argmax(axis=1)
+            results.append(([head.classes[b] for b in best], proba[np.arange(len(texts)), best]))
+        (intents, iconf), (urgencies, uconf) = results
+        return [TriagePrediction(i, float(ic), u, float(uc))
+                for i, ic, u, uc in zip(intents, iconf, urgencies, uconf)]
+
+    def predict_one(self, text: str) -> Optional[TriagePrediction]:
+        return self.predict([text])[0]
+
+
+triage_classifier = TriageClassifier(TRIAGE_MODEL_PATH)
+
+
+def wants_catalog(pred: Optional[TriagePrediction]) -> bool:
+    """True when the classifier confidently labels a question as a medicine lookup."""
+    return bool(pred and pred.intent in TRIAGE_CATALOG_INTENTS and pred.intent_confidence >= TRIAGE_MIN_CONFIDENCE)
+
+
+def decoding_profile(pred: Optional[TriagePrediction]) -> str:
+    """'brief' for confidently casual, non-urgent questions, else 'default' (see model_loader)."""
+    if (pred and pred.severity is None and pred.intent in TRIAGE_BRIEF_INTENTS
+            and pred.intent_confidence >= TRIAGE_MIN_CONFIDENCE):
+        return 'brief'
+    return 'default'
+
+
+def triage_severity(text: str) -> Optional[str]:
+    """Severity suggested by the classifier for free text, or None."""
+    pred = triage_classifier.predict_one(text)
+    return pred.severity if pred else None